@@ -1,24 +1,255 @@
 import os
+import json
+import time
+import uuid
+import logging
 import dotenv 
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 from chatbot_main import ClinicalChatbot
+from conversation_memory import ConversationMemory
+from session_store import create_session_store
+from session_snapshot import SessionSnapshotter
+from pdf_extraction import PDFExtractor
+from extraction_cache import ExtractionCache
+from uploads import UploadSpool, read_multipart_file, MalformedUpload, UploadTooLarge
+from summary_jobs import InProcessSummaryJobQueue
+from llm_providers import create_llm, DEFAULT_MODELS, DEFAULT_ESCALATION_MODEL
+from llm_scheduler import LLMScheduler, LLMQueueFull
+from llm_policy import LLMCallPolicy, RetryBudget
+from logging_config import configure_logging, request_id_var
+from metrics import (
+    REGISTRY, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, SESSION_STORE_SIZE, LLM_SCHEDULER_ACTIVE, LLM_SCHEDULER_QUEUED
+)
 dotenv.load_dotenv()
 
-# Loading API Key
+# Structured logs: LOG_FORMAT is json (one object per line) or text
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+configure_logging(LOG_LEVEL, LOG_FORMAT)
+logger = logging.getLogger("app")
+
+# Loading API Key (only required by the gemini provider)
 API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
-    raise ValueError("GOOGLE_API_KEY environment variable not set")
+
+# LLM provider: gemini, replay (recorded answers) or synthetic (simulated latency), see llm_providers.py
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH") or None
+# Model per task; extraction answers that are not valid JSON are retried on the escalation model
+LLM_EXTRACTION_MODEL = os.getenv("LLM_EXTRACTION_MODEL", DEFAULT_MODELS["extraction"])
+LLM_SUMMARY_MODEL = os.getenv("LLM_SUMMARY_MODEL", DEFAULT_MODELS["summary"])
+LLM_CONVERSATION_MODEL = os.getenv("LLM_CONVERSATION_MODEL", DEFAULT_MODELS["conversation"])
+LLM_ESCALATION_MODEL = os.getenv("LLM_ESCALATION_MODEL", DEFAULT_ESCALATION_MODEL)
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH") or None
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "true").lower() == "true"
+LLM_SYNTHETIC_LATENCY_MS = float(os.getenv("LLM_SYNTHETIC_LATENCY_MS", "800"))
+LLM_SYNTHETIC_LATENCY_DISTRIBUTION = os.getenv("LLM_SYNTHETIC_LATENCY_DISTRIBUTION", "lognormal")
+LLM_SYNTHETIC_LATENCY_SIGMA = float(os.getenv("LLM_SYNTHETIC_LATENCY_SIGMA", "0.5"))
+LLM_SYNTHETIC_TOKENS_PER_SECOND = float(os.getenv("LLM_SYNTHETIC_TOKENS_PER_SECOND", "50"))
+LLM_SYNTHETIC_OUTPUT_TOKENS = int(os.getenv("LLM_SYNTHETIC_OUTPUT_TOKENS", "200"))
+LLM_SYNTHETIC_ERROR_RATE = float(os.getenv("LLM_SYNTHETIC_ERROR_RATE", "0"))
+LLM_SYNTHETIC_SEED = int(os.getenv("LLM_SYNTHETIC_SEED")) if os.getenv("LLM_SYNTHETIC_SEED") else None
+
+# LLM scheduler: concurrent calls across all endpoints, and queued interactive/extraction calls before 429
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+
+# LLM call policy: total seconds per call site (0 disables), retries limited to a fraction of calls, hedging
+LLM_SUMMARY_DEADLINE = float(os.getenv("LLM_SUMMARY_DEADLINE", "30"))
+LLM_EXTRACTION_DEADLINE = float(os.getenv("LLM_EXTRACTION_DEADLINE", "60"))
+LLM_STREAM_DEADLINE = float(os.getenv("LLM_STREAM_DEADLINE", "60"))
+LLM_STREAM_FIRST_TOKEN_DEADLINE = float(os.getenv("LLM_STREAM_FIRST_TOKEN_DEADLINE", "15"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.1"))
+
+# Summary cache configuration
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "256"))
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", "3600"))
+
+# Conversation memory: token budget per session, part of it for the summary of older turns
+CONVERSATION_MEMORY_TOKENS = int(os.getenv("CONVERSATION_MEMORY_TOKENS", "1000"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "250"))
+
+# Session store configuration (memory, sqlite or redis)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "7200"))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+# Snapshot file that keeps memory-backend sessions across restarts (unset = disabled)
+SESSION_SNAPSHOT_PATH = os.getenv("SESSION_SNAPSHOT_PATH") or None
+SESSION_SNAPSHOT_INTERVAL = float(os.getenv("SESSION_SNAPSHOT_INTERVAL", "30"))
+
+# PDF text extraction process pool and budgets
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "30"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "200"))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# PDF LLM extraction: "chunked" covers the whole document, "single" only the first 3000 characters
+PDF_EXTRACTION_MODE = os.getenv("PDF_EXTRACTION_MODE", "chunked")
+PDF_CHUNK_TOKENS = int(os.getenv("PDF_CHUNK_TOKENS", "750"))
+PDF_CHUNK_CONCURRENCY = int(os.getenv("PDF_CHUNK_CONCURRENCY", "4"))
+PDF_MAX_CHUNKS = int(os.getenv("PDF_MAX_CHUNKS", "20"))
+# Extract sections under literal headings ("Allergies:", "Medications:") before calling the LLM
+PDF_RULE_EXTRACTION = os.getenv("PDF_RULE_EXTRACTION", "true").lower() == "true"
+
+# Uploads are read in chunks and rejected once over UPLOAD_MAX_BYTES; larger than
+# UPLOAD_SPOOL_BYTES they go to a temp file in UPLOAD_SPOOL_DIR instead of memory
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(PDF_MAX_BYTES)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+# Uploaded-file extraction cache (set EXTRACTION_CACHE_DIR to enable the disk tier)
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "512"))
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR") or None
+# The disk tier is trimmed to stay under EXTRACTION_CACHE_DISK_MB and entries expire after EXTRACTION_CACHE_TTL seconds
+EXTRACTION_CACHE_DISK_MB = int(os.getenv("EXTRACTION_CACHE_DISK_MB", "256"))
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Batch summary workers (concurrent LLM calls for /summaries/batch) and max session IDs per job
+SUMMARY_BATCH_WORKERS = int(os.getenv("SUMMARY_BATCH_WORKERS", "4"))
+SUMMARY_BATCH_MAX_SESSIONS = int(os.getenv("SUMMARY_BATCH_MAX_SESSIONS", "500"))
+# Seconds a finished batch job stays available for polling
+SUMMARY_BATCH_JOB_TTL = int(os.getenv("SUMMARY_BATCH_JOB_TTL", "3600"))
+
+# Worker processes; more than one requires the sqlite or redis session backend
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+def build_llm(model):
+    return create_llm(
+        LLM_PROVIDER,
+        api_key = API_KEY,
+        model = model,
+        record_path = LLM_RECORD_PATH,
+        replay_path = LLM_REPLAY_PATH,
+        replay_latency = LLM_REPLAY_LATENCY,
+        latency_ms = LLM_SYNTHETIC_LATENCY_MS,
+        latency_distribution = LLM_SYNTHETIC_LATENCY_DISTRIBUTION,
+        latency_sigma = LLM_SYNTHETIC_LATENCY_SIGMA,
+        tokens_per_second = LLM_SYNTHETIC_TOKENS_PER_SECOND,
+        output_tokens = LLM_SYNTHETIC_OUTPUT_TOKENS,
+        error_rate = LLM_SYNTHETIC_ERROR_RATE,
+        seed = LLM_SYNTHETIC_SEED
+    )
+
+# One client per distinct model, shared by the tasks configured to use it
+models = {}
+for model in (LLM_ESCALATION_MODEL, LLM_EXTRACTION_MODEL, LLM_SUMMARY_MODEL, LLM_CONVERSATION_MODEL):
+    if model not in models:
+        models[model] = build_llm(model)
 
 # Initialize Chatbot
-bot = ClinicalChatbot(api_key = API_KEY)
+bot = ClinicalChatbot(
+    api_key = API_KEY,
+    llm = models[LLM_ESCALATION_MODEL],
+    task_llms = {
+        "extraction": models[LLM_EXTRACTION_MODEL],
+        "summary": models[LLM_SUMMARY_MODEL],
+        "conversation": models[LLM_CONVERSATION_MODEL]
+    },
+    escalation_llm = models[LLM_ESCALATION_MODEL],
+    llm_scheduler = LLMScheduler(
+        max_concurrency = LLM_MAX_CONCURRENCY,
+        max_queue = LLM_MAX_QUEUE
+    ),
+    llm_policy = LLMCallPolicy(
+        deadlines = {
+            "generate_summary": LLM_SUMMARY_DEADLINE,
+            "extract_from_pdf": LLM_EXTRACTION_DEADLINE,
+            "stream_summary": LLM_STREAM_DEADLINE
+        },
+        first_token_deadlines = {
+            "stream_summary": LLM_STREAM_FIRST_TOKEN_DEADLINE
+        },
+        max_retries = LLM_MAX_RETRIES,
+        retry_budget = RetryBudget(ratio = LLM_RETRY_BUDGET_RATIO),
+        hedge = LLM_HEDGE,
+        hedge_min_delay = LLM_HEDGE_MIN_DELAY
+    ),
+    summary_cache_size = SUMMARY_CACHE_SIZE,
+    summary_cache_ttl = SUMMARY_CACHE_TTL,
+    conversation_memory = ConversationMemory(
+        max_tokens = CONVERSATION_MEMORY_TOKENS,
+        summary_tokens = CONVERSATION_SUMMARY_TOKENS
+    ),
+    session_store = create_session_store(
+        SESSION_BACKEND,
+        max_sessions = SESSION_MAX,
+        idle_ttl = SESSION_IDLE_TTL,
+        sweep_interval = SESSION_SWEEP_INTERVAL,
+        sqlite_path = SESSION_SQLITE_PATH,
+        redis_url = SESSION_REDIS_URL
+    ),
+    pdf_extractor = PDFExtractor(
+        max_workers = PDF_WORKERS,
+        timeout = PDF_TIMEOUT,
+        max_pages = PDF_MAX_PAGES,
+        max_bytes = PDF_MAX_BYTES
+    ),
+    extraction_cache = ExtractionCache(
+        max_entries = EXTRACTION_CACHE_SIZE,
+        disk_dir = EXTRACTION_CACHE_DIR,
+        disk_max_bytes = EXTRACTION_CACHE_DISK_MB * 1024 * 1024,
+        disk_ttl = EXTRACTION_CACHE_TTL
+    ),
+    pdf_chunked = PDF_EXTRACTION_MODE == "chunked",
+    pdf_chunk_tokens = PDF_CHUNK_TOKENS,
+    pdf_chunk_concurrency = PDF_CHUNK_CONCURRENCY,
+    pdf_max_chunks = PDF_MAX_CHUNKS,
+    pdf_rule_extraction = PDF_RULE_EXTRACTION
+)
+
+# Session count is read from the store when /metrics is scraped
+SESSION_STORE_SIZE.set_function(lambda: len(bot.sessions))
+LLM_SCHEDULER_ACTIVE.set_function(lambda: bot.llm_scheduler.active)
+LLM_SCHEDULER_QUEUED.set_function(lambda: bot.llm_scheduler.queued)
+
+# The sqlite and redis backends already outlive the process
+session_snapshots = None
+if SESSION_SNAPSHOT_PATH and SESSION_BACKEND == "memory":
+    session_snapshots = SessionSnapshotter(
+        bot.sessions,
+        SESSION_SNAPSHOT_PATH,
+        interval = SESSION_SNAPSHOT_INTERVAL
+    )
+
+# Background queue for bulk summary generation
+summary_jobs = InProcessSummaryJobQueue(
+    bot,
+    workers = SUMMARY_BATCH_WORKERS,
+    job_ttl = SUMMARY_BATCH_JOB_TTL
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background workers with the server"""
+    if session_snapshots is not None:
+        session_snapshots.load()
+        session_snapshots.start()
+    bot.sessions.start_sweeper()
+    await summary_jobs.start()
+    yield
+    await summary_jobs.stop()
+    if session_snapshots is not None:
+        # Final flush so sessions changed since the last snapshot survive the restart
+        session_snapshots.stop()
+    bot.sessions.stop_sweeper()
+    bot.pdf_extractor.shutdown()
+    bot.llm_policy.shutdown()
 
 # Initialize FastAPI app
 app = FastAPI(
     title = "Mediquery API",
-    description="API for the Pre-Consultation Clinical History Collection Chatbot"
+    description="API for the Pre-Consultation Clinical History Collection Chatbot",
+    lifespan = lifespan
 )
 
 # Configure CORS
@@ -30,6 +261,63 @@ app.add_middleware(
     allow_headers = ["*"],
 )
 
+@app.exception_handler(LLMQueueFull)
+async def llm_queue_full(request: Request, exc: LLMQueueFull):
+    """Too many LLM calls are queued: tell the client when to retry instead of waiting"""
+    logger.warning("LLM queue full, rejecting request", extra = {"retry_after": exc.retry_after})
+    return JSONResponse(
+        status_code = 429,
+        content = ErrorResponse(error = str(exc)).model_dump(),
+        headers = {"Retry-After": str(exc.retry_after)}
+    )
+
+# Room for the multipart boundaries and headers around the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads whose declared size is over the limit before reading the body"""
+    content_length = request.headers.get("content-length")
+    if (UPLOAD_MAX_BYTES and request.method == "POST" and content_length and content_length.isdigit()
+            and int(content_length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD):
+        logger.info("Rejected %s byte request body", content_length)
+        return upload_too_large_response(f"File is larger than the {UPLOAD_MAX_BYTES // 1024} KB limit")
+    return await call_next(request)
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large(request: Request, exc: UploadTooLarge):
+    """Upload without a usable Content-Length crossed the limit while it was read"""
+    return upload_too_large_response(str(exc))
+
+def upload_too_large_response(message):
+    return JSONResponse(
+        status_code = 413,
+        content = ErrorResponse(error = message).model_dump()
+    )
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """Tag logs with the caller's X-Request-ID (or a new one) and echo it back"""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and time them per route template (not per session ID)"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method = request.method, path = path)
+    HTTP_REQUESTS.inc(method = request.method, path = path, status = str(response.status_code))
+    return response
+
 # Define Request/Response Models
 
 class ChatRequest(BaseModel):
@@ -49,9 +337,27 @@ class SessionWithDataResponse(BaseModel):
     welcome_message: str
     pre_filled_sections: list
     extracted_data: dict
+    metadata: dict = {}
     
 class SummaryResponse(BaseModel):
     summary: str
+
+class AnalyzeResponse(BaseModel):
+    pre_filled_sections: list
+    extracted_data: dict
+    summary: str
+    metadata: dict = {}
+    
+class BatchSummaryRequest(BaseModel):
+    session_ids: list[str]
+
+class BatchSummaryJobResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    results: dict
     
 class ErrorResponse(BaseModel):
     error: str
@@ -66,94 +372,168 @@ def create_new_session():
     welcome_message = bot.get_welcome_message()
     return SessionResponse(session_id = session_id, welcome_message = welcome_message)
 
-@app.post('/session/new/with-file', response_model = SessionWithDataResponse | ErrorResponse)
-async def create_session_with_file(file: UploadFile = File(...)):
-    """
-    Starts a new session with pre-filled data from uploaded JSON or PDF file.
-    
-    - Accepts: JSON (.json) or PDF (.pdf) files only
-    - Extracts medical history from the file
-    - Pre-fills session data
-    - Returns session ready to continue with missing information
+class UploadError(Exception):
+    """Uploaded file was rejected; the message is shown to the user"""
+
+# Upload endpoints read the multipart body themselves, so it is documented here
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}}
+        }}}
+    }
+}
+
+async def read_upload(request: Request):
+    """Validates an uploaded JSON or PDF file and returns (SpooledUpload, file_type)
+
+    The multipart body is parsed as it arrives and the file written once, straight
+    into the spool, stopping as soon as it is over the limit. The caller must
+    close() the returned upload.
     """
-    
-    try:
-        # Validate file is provided
-        if not file or not file.filename:
-            print("Error: No file provided")
-            return ErrorResponse(error="No file provided. Please select a file to upload.")
+    def open_spool(filename):
+        logger.debug("Received file", extra = {"upload_filename": filename})
         
-        print(f"Received file: {file.filename}")
-        
-        # Validate file type
+        # Validate file type before any of the content is read
         allowed_extensions = ['.json', '.pdf']
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        
-        print(f"File extension: {file_ext}")
+        file_ext = os.path.splitext(filename)[1].lower()
         
         if file_ext not in allowed_extensions:
-            print(f"Invalid file type: {file_ext}")
+            logger.info("Invalid file type: %s", file_ext)
             raise HTTPException(
                 status_code=400, 
                 detail=f"Invalid file type. Only JSON and PDF files are allowed. Got: {file_ext}"
             )
         
-        # Read file content
-        print("Reading file content...")
-        content = await file.read()
-        print(f"File size: {len(content)} bytes")
-        
-        if len(content) == 0:
-            print("Error: Empty file")
-            return ErrorResponse(error="The uploaded file is empty. Please upload a valid file with content.")
-        
-        # Determine file type and process
-        print(f"Processing {file_ext} file...")
-        if file_ext == '.json':
-            content_str = content.decode('utf-8')
-            print(f"JSON content length: {len(content_str)} characters")
-            result = bot.create_session_with_file_data(content_str, "json")
-        elif file_ext == '.pdf':
-            print(f"PDF content length: {len(content)} bytes")
-            result = bot.create_session_with_file_data(content, "pdf")
-        else:
-            return ErrorResponse(error=f"Unsupported file type: {file_ext}")
-        
-        print(f"Processing result: {list(result.keys())}")
+        return UploadSpool(
+            max_bytes = UPLOAD_MAX_BYTES,
+            spool_bytes = UPLOAD_SPOOL_BYTES,
+            spool_dir = UPLOAD_SPOOL_DIR,
+            encoding = 'utf-8' if file_ext == '.json' else None
+        )
+    
+    # Read file content in chunks, stopping as soon as it is over the limit
+    try:
+        filename, content = await read_multipart_file(request, open_spool)
+    except UploadTooLarge:
+        # Answered with 413 by upload_too_large, like a declared size over the limit
+        logger.info("Upload too large")
+        raise
+    except MalformedUpload as malformed:
+        logger.info("Malformed upload: %s", malformed)
+        raise UploadError(f"{malformed}. Please select a file to upload.")
+    
+    # Validate file is provided
+    if not filename:
+        if content is not None:
+            content.close()
+        logger.info("No file provided")
+        raise UploadError("No file provided. Please select a file to upload.")
+    
+    file_type = "json" if os.path.splitext(filename)[1].lower() == '.json' else "pdf"
+    logger.debug("Read %d bytes", len(content), extra = {"upload_filename": filename})
+    
+    if len(content) == 0:
+        content.close()
+        logger.info("Empty file", extra = {"upload_filename": filename})
+        raise UploadError("The uploaded file is empty. Please upload a valid file with content.")
+    
+    return content, file_type
+
+@app.post('/session/new/with-file', response_model = SessionWithDataResponse | ErrorResponse, openapi_extra = UPLOAD_REQUEST_BODY)
+async def create_session_with_file(request: Request):
+    """
+    Starts a new session with pre-filled data from uploaded JSON or PDF file.
+    
+    - Accepts: JSON (.json) or PDF (.pdf) files only
+    - Extracts medical history from the file
+    - Pre-fills session data
+    - Returns session ready to continue with missing information
+    """
+    
+    content = None
+    try:
+        content, file_type = await read_upload(request)
+        result = await bot.acreate_session_with_file_data(content, file_type)
         
         # Check for errors
         if "error" in result:
-            print(f"Processing error: {result['error']}")
+            logger.info("Processing error: %s", result["error"])
             return ErrorResponse(error=result["error"])
         
-        print("File processed successfully")
         return SessionWithDataResponse(
             session_id=result["session_id"],
             welcome_message=result["welcome_message"],
             pre_filled_sections=result["pre_filled_sections"],
-            extracted_data=result["extracted_data"]
+            extracted_data=result["extracted_data"],
+            metadata=result["metadata"]
         )
         
+    except UploadError as upload_error:
+        return ErrorResponse(error=str(upload_error))
+    except (LLMQueueFull, UploadTooLarge):
+        raise
     except HTTPException as http_ex:
         # Re-raise HTTP exceptions
-        print(f"HTTP Exception: {http_ex.detail}")
+        logger.info("HTTP exception: %s", http_ex.detail)
         raise http_ex
     except UnicodeDecodeError as ude:
-        print(f"Unicode decode error: {str(ude)}")
+        logger.info("Unicode decode error: %s", ude)
         return ErrorResponse(error="Invalid file encoding. Please ensure the file is in UTF-8 format.")
     except Exception as e:
         # Log the full error for debugging
-        print(f"Unexpected error processing file: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error processing file")
         return ErrorResponse(error=f"Failed to process file: {str(e)}")
+    finally:
+        if content is not None:
+            content.close()
+
+@app.post('/analyze', response_model = AnalyzeResponse | ErrorResponse, openapi_extra = UPLOAD_REQUEST_BODY)
+async def analyze_file(request: Request):
+    """
+    Extracts medical history from an uploaded JSON or PDF file and summarizes it in one request.
+    
+    - No session is created; nothing is kept after the response
+    - The summary is generated from the extracted data as soon as extraction finishes
+    """
+    
+    content = None
+    try:
+        content, file_type = await read_upload(request)
+        result = await bot.aanalyze_file(content, file_type)
+        
+        if "error" in result:
+            logger.info("Processing error: %s", result["error"])
+            return ErrorResponse(error=result["error"])
+        
+        return AnalyzeResponse(**result)
+        
+    except UploadError as upload_error:
+        return ErrorResponse(error=str(upload_error))
+    except (LLMQueueFull, UploadTooLarge):
+        raise
+    except HTTPException as http_ex:
+        logger.info("HTTP exception: %s", http_ex.detail)
+        raise http_ex
+    except UnicodeDecodeError as ude:
+        logger.info("Unicode decode error: %s", ude)
+        return ErrorResponse(error="Invalid file encoding. Please ensure the file is in UTF-8 format.")
+    except Exception as e:
+        logger.exception("Unexpected error analyzing file")
+        return ErrorResponse(error=f"Failed to process file: {str(e)}")
+    finally:
+        if content is not None:
+            content.close()
 
 @app.post('/chat/{session_id}', response_model = ChatResponse | ErrorResponse)
 def post_chat_message(session_id: str, request: ChatRequest):
     """Sends a patient's message to the chatbot and gets a response."""
     
     # Validate session exists
-    if session_id not in bot.sessions:
+    if bot.sessions.get(session_id) is None:
         return ErrorResponse(error = "Invalid session ID")
     
     # Validate message is not empty
@@ -176,19 +556,98 @@ def post_chat_message(session_id: str, request: ChatRequest):
     )
     
 @app.get("/summary/{session_id}", response_model = SummaryResponse | ErrorResponse)
-def get_summary(session_id: str):
+async def get_summary(session_id: str):
     """Generates the final clinical summary for the doctor."""
-    if session_id not in bot.sessions:
+    session = bot.sessions.get(session_id)
+    if session is None:
         return ErrorResponse(error = "Invalid session ID")
     
-    if not bot.sessions[session_id]["completed"]:
+    if not session.completed:
         return ErrorResponse(error = "Conversation not yet completed")
     
-    summary = bot.generate_summary(session_id)
+    summary = await bot.agenerate_summary(session_id)
     return SummaryResponse(summary = summary)
 
+@app.get("/summary/{session_id}/stream", response_model = ErrorResponse)
+async def stream_summary(session_id: str):
+    """
+    Streams the clinical summary as Server-Sent Events while the LLM generates it.
+    
+    - `token` events carry the next chunk of summary text
+    - `fallback` event carries the full template summary if the LLM fails mid-stream or streams no text
+    - `done` event marks the end of the stream
+    """
+    session = bot.sessions.get(session_id)
+    if session is None:
+        return ErrorResponse(error = "Invalid session ID")
+    
+    if not session.completed:
+        return ErrorResponse(error = "Conversation not yet completed")
+    
+    # Wait for the first event here so a full LLM queue is still answered with 429
+    events = bot.astream_summary(session_id)
+    first = await anext(events, None)
+    
+    async def event_stream():
+        if first is not None:
+            yield f"event: {first[0]}\ndata: {json.dumps({'text': first[1]})}\n\n"
+            async for event, text in events:
+                yield f"event: {event}\ndata: {json.dumps({'text': text})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type = "text/event-stream",
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/summaries/batch", response_model = BatchSummaryJobResponse | ErrorResponse)
+async def create_summary_batch(request: BatchSummaryRequest):
+    """
+    Queues summary generation for many sessions, e.g. every completed session at end of clinic day.
+    
+    Returns a job immediately; poll `/summaries/batch/{job_id}` for progress and results.
+    """
+    if WORKERS > 1:
+        # Jobs live in the accepting process, and polls may reach any worker
+        return ErrorResponse(error = "Batch summaries are not available when the server runs with more than one worker.")
+    
+    if not request.session_ids:
+        return ErrorResponse(error = "Please provide at least one session ID.")
+    
+    if len(request.session_ids) > SUMMARY_BATCH_MAX_SESSIONS:
+        return ErrorResponse(error = f"Too many sessions. A batch can contain at most {SUMMARY_BATCH_MAX_SESSIONS} session IDs.")
+    
+    job = summary_jobs.submit(request.session_ids)
+    return BatchSummaryJobResponse(**job)
+
+@app.get("/summaries/batch/{job_id}", response_model = BatchSummaryJobResponse | ErrorResponse)
+def get_summary_batch(job_id: str):
+    """Returns progress of a batch summary job and the summaries finished so far."""
+    job = summary_jobs.get(job_id)
+    if job is None:
+        return ErrorResponse(error = "Invalid job ID")
+    
+    return BatchSummaryJobResponse(**job)
+
+@app.get("/sessions/stats")
+def get_session_stats():
+    """Reports session store size and eviction counters."""
+    return bot.sessions.stats()
+
+@app.get("/metrics", response_class = PlainTextResponse)
+def get_metrics():
+    """Request, stage and LLM timings in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type = "text/plain; version=0.0.4")
+
 # Run server
 
 if __name__ == "__main__":
-    uvicorn.run(app, host = "0.0.0.0", port = 8080)
+    if WORKERS > 1:
+        if SESSION_BACKEND == "memory":
+            raise ValueError("WORKERS > 1 requires SESSION_BACKEND=sqlite or SESSION_BACKEND=redis")
+        # Multiple workers need an import string so each process builds its own app
+        uvicorn.run("app:app", host = "0.0.0.0", port = 8080, workers = WORKERS)
+    else:
+        uvicorn.run(app, host = "0.0.0.0", port = 8080)
     
\ No newline at end of file
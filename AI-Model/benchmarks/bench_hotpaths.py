@@ -0,0 +1,181 @@
+"""
+Microbenchmarks for the ClinicalChatbot hot paths, run against a fake LLM
+
+Usage:
+    python benchmarks/bench_hotpaths.py --output bench_results.json
+    python benchmarks/bench_hotpaths.py --baseline bench_results.json --threshold 1.25
+"""
+import os
+import sys
+import json
+import argparse
+
+from bench_utils import (
+    AI_MODEL_DIR, FakeLLM, make_pdf, medical_record_pages, bench, write_results, compare_to_baseline
+)
+from chatbot_main import ClinicalChatbot
+from pdf_extraction import PDFExtractor, read_pdf_text
+
+INTERVIEW_ANSWERS = [
+    "I have had a pounding headache on the right side for three days",
+    "It started after long hours at the computer and gets worse with screens",
+    "Type 2 diabetes diagnosed five years ago and high blood pressure",
+    "Metformin 500mg twice daily and lisinopril 10mg every morning",
+    "Penicillin gives me a rash",
+    "My father had heart disease and my mother has diabetes",
+    "Software developer, I drink two or three beers on weekends",
+    "no"
+]
+
+
+def build_bot(summary_cache_size=256):
+    # Extract PDFs inline so the timings measure parsing, not process hand-off
+    return ClinicalChatbot(
+        api_key=None,
+        summary_cache_size=summary_cache_size,
+        pdf_extractor=PDFExtractor(max_workers=0),
+        llm=FakeLLM()
+    )
+
+
+def large_json_export(noise_keys=20000):
+    """Multi-megabyte export with the useful keys buried among unrelated fields"""
+    data = {f"observation_{i}": {"code": f"LOINC-{i}", "value": i * 0.1, "note": "within normal limits " * 5}
+            for i in range(noise_keys)}
+    data.update({
+        "chief_complaint": "Recurring headaches",
+        "medications": [f"Medication {i} 10mg daily" for i in range(200)],
+        "allergies": "Penicillin - causes rash",
+        "family_history": {"father": "heart disease", "mother": "diabetes"},
+        "social_history": "Non-smoker, occasional alcohol",
+        "ros": "Negative except as noted"
+    })
+    return json.dumps(data)
+
+
+def bundle_json_export(entries=50000):
+    """FHIR-style bundle: the record's fields sit a few levels deep among observations"""
+    observations = [
+        {"resource": {"resourceType": "Observation", "id": str(i), "valueQuantity": {"value": i * 0.1},
+                      "note": [{"text": "within normal limits"}]}}
+        for i in range(entries)
+    ]
+    record = {"resource": {
+        "resourceType": "Condition",
+        "chiefComplaint": "Recurring headaches",
+        "presentIllness": "Started three weeks ago",
+        "pastMedicalHistory": ["Hypertension", "Type 2 diabetes"],
+        "medications": [f"Medication {i} 10mg daily" for i in range(20)],
+        "allergies": "Penicillin - causes rash",
+        "familyHistory": {"father": "heart disease"},
+        "socialHistory": "Non-smoker",
+        "reviewOfSystems": "Negative except as noted"
+    }}
+    return json.dumps({"resourceType": "Bundle", "entry": observations[:100] + [record] + observations[100:]})
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    bot = build_bot()
+    uncached_bot = build_bot(summary_cache_size=0)
+    results = []
+
+    # get_response: negative-response scan, acknowledgment and history appends
+    results.append(bench(
+        "get_response/answer",
+        lambda sid: bot.get_response(sid, INTERVIEW_ANSWERS[0]),
+        iterations=5000 // scale, setup=bot.create_session
+    ))
+    results.append(bench(
+        "get_response/negative_answer",
+        lambda sid: bot.get_response(sid, "none"),
+        iterations=5000 // scale, setup=bot.create_session
+    ))
+
+    def full_interview(sid):
+        for answer in INTERVIEW_ANSWERS:
+            bot.get_response(sid, answer)
+
+    results.append(bench(
+        "get_response/full_interview",
+        full_interview, iterations=1000 // scale, setup=bot.create_session
+    ))
+
+    # JSON extraction
+    with open(os.path.join(AI_MODEL_DIR, "test_medical_data.json"), "r", encoding="utf-8") as f:
+        small_json = f.read()
+    large_json = large_json_export()
+    results.append(bench(
+        "extract_from_json/small",
+        lambda _: bot._extract_from_json(small_json), iterations=5000 // scale
+    ))
+    results.append(bench(
+        f"extract_from_json/large_{len(large_json) // 1024}kb",
+        lambda _: bot._extract_from_json(large_json), iterations=max(2, 20 // scale), warmup=1
+    ))
+    bundle_json = bundle_json_export()
+    results.append(bench(
+        f"extract_from_json/bundle_{len(bundle_json) // 1024}kb",
+        lambda _: bot._extract_from_json(bundle_json), iterations=max(2, 200 // scale), warmup=1
+    ))
+
+    # PDF text extraction and the full PDF path (rule extraction + fake LLM)
+    pdf_5 = make_pdf(medical_record_pages(5))
+    pdf_50 = make_pdf(medical_record_pages(50))
+    results.append(bench(
+        "pdf_text/5_pages", lambda _: read_pdf_text(pdf_5), iterations=max(2, 50 // scale), warmup=2
+    ))
+    results.append(bench(
+        "pdf_text/50_pages", lambda _: read_pdf_text(pdf_50), iterations=max(2, 10 // scale), warmup=1
+    ))
+    results.append(bench(
+        "extract_from_pdf/5_pages", lambda _: bot._extract_from_pdf(pdf_5),
+        iterations=max(2, 50 // scale), warmup=2
+    ))
+
+    # Prompt construction
+    sid = bot.create_session()
+    full_interview(sid)
+    session = bot.sessions[sid]
+    results.append(bench(
+        "build_summary_prompt",
+        lambda _: bot._build_summary_prompt(session.section_data), iterations=20000 // scale
+    ))
+    results.append(bench(
+        "create_chain", lambda _: bot._create_chain(session), iterations=5000 // scale
+    ))
+    results.append(bench(
+        "generate_summary/cache_hit", lambda _: bot.generate_summary(sid), iterations=20000 // scale
+    ))
+    uncached_sid = uncached_bot.create_session()
+    results.append(bench(
+        "generate_summary/cache_miss_fake_llm",
+        lambda _: uncached_bot.generate_summary(uncached_sid), iterations=5000 // scale
+    ))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ClinicalChatbot hot paths")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="Compare against an earlier results file")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Fail when a mean time exceeds the baseline by this factor (default 1.25)")
+    parser.add_argument("--quick", action="store_true", help="Run a tenth of the iterations")
+    args = parser.parse_args()
+
+    results = run(quick=args.quick)
+    write_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']}: {regression['baseline_us']} us -> "
+                  f"{regression['current_us']} us ({regression['ratio']}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Prompt construction with the precompiled PromptRegistry against rebuilding every call
+
+The "rebuilt" variants reproduce what the chatbot did before the registry:
+a fresh f-string system prompt, ChatPromptTemplate and message history per
+conversation turn, a timestamp formatted for every summary prompt and the
+PDF key list joined for every chunk. Both summary and PDF variants render
+the same parsed template, which costs the same as the old inline f-strings.
+
+Usage:
+    python benchmarks/bench_prompts.py --output prompt_results.json
+"""
+import sys
+import argparse
+import warnings
+from datetime import datetime
+
+from bench_utils import bench, peak_allocation, write_results
+from bench_hotpaths import build_bot, INTERVIEW_ANSWERS
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import HumanMessage, AIMessage
+from prompts import CONVERSATION_SYSTEM_PROMPT, SUMMARY_DEFAULTS
+from conversation_memory import PATIENT
+
+
+def rebuilt_conversation_messages(bot, session, user_input):
+    section = session.current_section
+    system = CONVERSATION_SYSTEM_PROMPT.format(focus_area=section.replace("_", " ").title())
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{input}")
+    ])
+    history = InMemoryChatMessageHistory()
+    lines = [("Patient: " if role == PATIENT else "Assistant: ") + content for role, content, _ in session.messages]
+    for msg in lines[-6:]:
+        if "Patient:" in msg:
+            history.add_message(HumanMessage(content=msg.replace("Patient: ", "")))
+        else:
+            history.add_message(AIMessage(content=msg.replace("Assistant: ", "")))
+    return prompt.format_messages(history=history.messages, input=user_input)
+
+
+def rebuilt_summary(bot, section_data):
+    values = {key: section_data.get(key, default) for key, default in SUMMARY_DEFAULTS.items()}
+    values["generated"] = datetime.now().strftime("%Y-%m-%d %H:%M")
+    return bot.prompts.summary_prompt.render(values)
+
+
+def rebuilt_pdf_parse(bot, text, sections):
+    keys = ",\n".join(f'    "{section}": "{bot.PDF_SECTION_HINTS[section]}"' for section in sections)
+    return bot.prompts.pdf_parse_prompt.render({"text": text, "keys": keys})
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    bot = build_bot()
+    sid = bot.create_session()
+    for answer in INTERVIEW_ANSWERS[:4]:
+        bot.get_response(sid, answer)
+    session = bot.sessions[sid]
+    section_data = session.section_data
+    chunk = "Progress note: vitals stable, no acute distress. " * 60
+    missing = bot.SECTIONS[3:]
+
+    cases = [
+        ("conversation_messages", lambda _: rebuilt_conversation_messages(bot, session, "It hurts"),
+         lambda _: bot._create_chain(session).messages("It hurts"), 5000),
+        ("summary_prompt", lambda _: rebuilt_summary(bot, section_data),
+         lambda _: bot._build_summary_prompt(section_data), 20000),
+        ("pdf_parse_prompt", lambda _: rebuilt_pdf_parse(bot, chunk, missing),
+         lambda _: bot._build_pdf_parse_prompt(chunk, missing), 20000)
+    ]
+
+    results = []
+    for name, rebuilt, precompiled, iterations in cases:
+        for variant, fn in (("rebuilt", rebuilt), ("precompiled", precompiled)):
+            result = bench(f"prompts/{name}/{variant}", fn, iterations=iterations // scale)
+            result["peak_alloc_bytes"] = peak_allocation(fn)
+            results.append(result)
+        before, after = results[-2], results[-1]
+        print(f"{'':<45} {before['mean_us'] / max(after['mean_us'], 1e-9):.1f}x faster, "
+              f"peak allocation {before['peak_alloc_bytes']} -> {after['peak_alloc_bytes']} bytes", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark precompiled prompts against per-call rebuilding")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="Run a tenth of the iterations")
+    args = parser.parse_args()
+
+    # The rebuilt variant uses InMemoryChatMessageHistory, which newer LangChain marks deprecated
+    warnings.simplefilter("ignore", DeprecationWarning)
+    write_results(run(quick=args.quick), args.output)
+
+
+if __name__ == "__main__":
+    main()
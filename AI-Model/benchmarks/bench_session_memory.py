@@ -0,0 +1,105 @@
+"""
+Bytes per session for the slotted Session against the previous dict layout
+
+The dict layout is what sessions looked like before Session: a dict with a
+string-keyed section_data dict and a "history" list holding a freshly built
+"Patient: ..."/"Assistant: ..." string for every turn. Both layouts are
+measured with tracemalloc while holding N sessions, new and after a full
+interview in which every session types its own answers.
+
+Usage:
+    python benchmarks/bench_session_memory.py --sessions 100000 --output memory_results.json
+"""
+import gc
+import sys
+import argparse
+import tracemalloc
+
+from bench_utils import write_results
+from bench_hotpaths import build_bot, INTERVIEW_ANSWERS
+from session import Session
+
+
+def dict_session(bot):
+    return {
+        "section_index": 0,
+        "history": [],
+        "completed": False,
+        "awaiting_file_response": False,
+        "section_data": bot._new_section_data()
+    }
+
+
+def dict_interview(bot, session, answers):
+    for answer in answers:
+        index = min(session["section_index"], len(bot.SECTIONS) - 1)
+        session["history"].append(f"Patient: {answer}")
+        session["section_data"][bot.SECTIONS[index]] = answer
+        # The reply text used to be formatted anew for every session
+        session["history"].append(f"Assistant: {bot._build_reply(index, False)}")
+        session["section_index"] += 1
+    session["completed"] = True
+
+
+def slotted_interview(bot, session, answers):
+    for answer in answers:
+        bot._process_answer(session, answer)
+
+
+def measure(build, count):
+    """Traced bytes per object while count objects from build(i) are alive"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = [build(i) for i in range(count)]
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del kept
+    return round(used / count, 1)
+
+
+def run(count):
+    bot = build_bot()
+
+    def answers(i):
+        # Each patient sends their own text, so answer strings are not shared between sessions
+        return [f"{answer} (visit {i})" for answer in INTERVIEW_ANSWERS]
+
+    def dict_completed(i):
+        session = dict_session(bot)
+        dict_interview(bot, session, answers(i))
+        return session
+
+    def slotted_completed(i):
+        session = Session()
+        slotted_interview(bot, session, answers(i))
+        return session
+
+    cases = [
+        ("session_memory/new/dict", lambda i: dict_session(bot)),
+        ("session_memory/new/slotted", lambda i: Session()),
+        ("session_memory/completed/dict", dict_completed),
+        ("session_memory/completed/slotted", slotted_completed)
+    ]
+    results = []
+    for name, build in cases:
+        per_session = measure(build, count)
+        print(f"{name:<45} {per_session:>10.1f} bytes/session over {count} sessions", file=sys.stderr)
+        results.append({"name": name, "sessions": count, "bytes_per_session": per_session})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per session")
+    parser.add_argument("--sessions", type=int, default=100000, help="Sessions held at once (default 100000)")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="Hold a tenth of the sessions")
+    args = parser.parse_args()
+
+    write_results(run(args.sessions // 10 if args.quick else args.sessions), args.output)
+
+
+if __name__ == "__main__":
+    main()
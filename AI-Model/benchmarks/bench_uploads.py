@@ -0,0 +1,107 @@
+"""
+Upload reading with read_multipart_file against Starlette's form parsing
+
+The "read" variant is what the upload endpoints did before they parsed the
+body themselves: Starlette's request.form() spools the multipart body, then
+await file.read() loads the whole upload, which is hashed and wrapped in a
+BytesIO for the PDF reader. The "streamed" variant feeds the same request
+stream to read_multipart_file, which writes the file part into an
+UploadSpool (a temp file past 1 MB) and maps it, as read_upload does now.
+Each request body is served from a file on disk in 64 KB messages, like an
+ASGI server, so only the memory used to read it is traced.
+
+Usage:
+    python benchmarks/bench_uploads.py --output upload_results.json
+"""
+import os
+import sys
+import asyncio
+import hashlib
+import argparse
+import tempfile
+from io import BytesIO
+
+from bench_utils import bench, peak_allocation, write_results
+from starlette.requests import Request
+from uploads import UploadSpool, read_multipart_file
+
+SIZES_MB = (1, 5, 20)
+BOUNDARY = b"bench-boundary"
+# Body size of each ASGI http.request message
+MESSAGE_BYTES = 64 * 1024
+
+
+def write_multipart_body(path, size):
+    """Write a multipart/form-data body holding one file field of size random bytes"""
+    with open(path, "wb") as f:
+        f.write(b"--" + BOUNDARY + b"\r\nContent-Disposition: form-data; name=\"file\"; filename=\"upload.pdf\"\r\n"
+                b"Content-Type: application/pdf\r\n\r\n")
+        f.write(os.urandom(size))
+        f.write(b"\r\n--" + BOUNDARY + b"--\r\n")
+
+
+def streamed_request(f):
+    """Request whose body is read from the open file f"""
+    async def receive():
+        chunk = f.read(MESSAGE_BYTES)
+        return {"type": "http.request", "body": chunk, "more_body": len(chunk) == MESSAGE_BYTES}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)]
+    }
+    return Request(scope, receive)
+
+
+def read_whole(path):
+    async def read():
+        with open(path, "rb") as f:
+            form = await streamed_request(f).form()
+            try:
+                content = await form["file"].read()
+                hashlib.sha256(content).hexdigest()
+                return len(BytesIO(content).getbuffer())
+            finally:
+                await form.close()
+    return asyncio.run(read())
+
+
+def read_streamed(path):
+    async def read():
+        with open(path, "rb") as f:
+            _, upload = await read_multipart_file(streamed_request(f), lambda filename: UploadSpool())
+        try:
+            with upload.buffer() as buffer:
+                return len(buffer)
+        finally:
+            upload.close()
+    return asyncio.run(read())
+
+
+def run(quick=False):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES_MB:
+            path = os.path.join(directory, f"{size}mb.body")
+            write_multipart_body(path, size * 1024 * 1024)
+            for variant, fn in (("read", read_whole), ("streamed", read_streamed)):
+                result = bench(f"upload/{variant}/{size}mb", lambda _: fn(path), iterations=5 if quick else 20, warmup=1)
+                result["peak_alloc_bytes"] = peak_allocation(fn, path)
+                results.append(result)
+            before, after = results[-2], results[-1]
+            print(f"{'':<45} peak allocation {before['peak_alloc_bytes'] // 1024} -> "
+                  f"{after['peak_alloc_bytes'] // 1024} KB", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed multipart upload reading")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="Run fewer iterations")
+    args = parser.parse_args()
+    write_results(run(quick=args.quick), args.output)
+
+
+if __name__ == "__main__":
+    main()
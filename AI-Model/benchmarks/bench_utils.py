@@ -0,0 +1,171 @@
+"""
+Shared helpers for the benchmark scripts: a fake LLM, a PDF generator and a timer
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import platform
+import statistics
+import tracemalloc
+
+# Benchmarks import the service modules from the parent directory
+AI_MODEL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if AI_MODEL_DIR not in sys.path:
+    sys.path.insert(0, AI_MODEL_DIR)
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    """Stand-in for the chat model that answers instantly with canned content"""
+
+    EXTRACTION_ANSWER = json.dumps({
+        "medications": "Metformin 500mg BID",
+        "allergies": "Penicillin",
+        "chief_complaint": None
+    })
+    SUMMARY_ANSWER = "**ELECTRONIC HEALTH RECORD - CLINICAL SUMMARY**\n" + "Patient reports headache. " * 80
+
+    def __init__(self):
+        self.calls = 0
+
+    def _answer(self, prompt):
+        self.calls += 1
+        if isinstance(prompt, str) and "Return ONLY valid JSON" in prompt:
+            return FakeMessage(self.EXTRACTION_ANSWER)
+        return FakeMessage(self.SUMMARY_ANSWER)
+
+    def invoke(self, prompt, **kwargs):
+        return self._answer(prompt)
+
+    async def ainvoke(self, prompt, **kwargs):
+        return self._answer(prompt)
+
+    async def astream(self, prompt, **kwargs):
+        for word in self._answer(prompt).content.split(" "):
+            await asyncio.sleep(0)
+            yield FakeMessage(word + " ")
+
+
+def make_pdf(pages):
+    """Build a minimal text PDF with one page per string (lines split on newlines)"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_id = 3 + 2 * len(pages)
+    for i, page_text in enumerate(pages):
+        lines = []
+        for line in page_text.split("\n"):
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            lines.append(f"({escaped}) Tj T*")
+        stream = "BT /F1 10 Tf 50 750 Td 12 TL " + " ".join(lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def medical_record_pages(page_count):
+    """Generate clinic-printout style page text"""
+    pages = []
+    for i in range(page_count):
+        pages.append("\n".join([
+            f"Visit note page {i + 1}",
+            "Patient seen for follow-up of chronic conditions.",
+            f"Medications: Metformin 500mg BID, Lisinopril {10 + i}mg daily",
+            "Allergies: Penicillin (rash)",
+            "Family History: father with coronary artery disease",
+            "Social History: non-smoker, occasional alcohol",
+        ] + [f"Progress note line {j}: vitals stable, no acute distress." for j in range(30)]))
+    return pages
+
+
+def bench(name, fn, iterations=1000, warmup=10, setup=None):
+    """Time fn over several iterations; setup() output is passed to fn and not timed"""
+    for _ in range(warmup):
+        fn(setup() if setup else None)
+
+    samples = []
+    for _ in range(iterations):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1e6)
+
+    samples.sort()
+    result = {
+        "name": name,
+        "iterations": iterations,
+        "mean_us": round(statistics.fmean(samples), 3),
+        "p50_us": round(samples[len(samples) // 2], 3),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min_us": round(samples[0], 3)
+    }
+    # Progress goes to stderr so stdout holds nothing but the JSON results
+    print(f"{name:<45} mean {result['mean_us']:>12.1f} us   p95 {result['p95_us']:>12.1f} us", file=sys.stderr)
+    return result
+
+
+def peak_allocation(fn, arg=None):
+    """Peak bytes allocated by tracemalloc during one fn(arg) call"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn(arg)
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def environment_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def write_results(results, output_path=None):
+    """Write results as JSON to a file, or to stdout when no path is given"""
+    payload = json.dumps({"environment": environment_info(), "results": results}, indent=2)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+        print(f"\nResults written to {output_path}", file=sys.stderr)
+    else:
+        print(payload)
+
+
+def compare_to_baseline(results, baseline_path, threshold):
+    """Return benchmarks whose mean time grew by more than threshold x the baseline"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["name"])
+        if previous and previous["mean_us"] > 0:
+            ratio = result["mean_us"] / previous["mean_us"]
+            if ratio > threshold:
+                regressions.append({"name": result["name"], "baseline_us": previous["mean_us"],
+                                    "current_us": result["mean_us"], "ratio": round(ratio, 2)})
+    return regressions
@@ -1,32 +1,44 @@
 import os
+import re
 import uuid
 import json
+import time
+import logging
+import asyncio
 from datetime import datetime
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.messages import HumanMessage, AIMessage
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
+from pdf_extraction import PDFExtractor, chunk_text, CHARS_PER_TOKEN
+from summary_cache import SummaryCache, section_data_hash
+from extraction_cache import ExtractionCache, extraction_key, file_hash
+from uploads import SpooledUpload
+from section_parser import HeadingSectionExtractor
+from json_extraction import JSONSectionExtractor
+from session_store import InMemorySessionStore
+from llm_providers import create_llm, model_name, DEFAULT_MODELS
+from singleflight import SingleFlight
+from prompts import PromptRegistry
+from conversation_memory import ConversationMemory, PATIENT, ASSISTANT
+from session import Session, SECTIONS as SESSION_SECTIONS, SECTION_INDEX, SECTION_DEFAULTS, share
+from llm_scheduler import LLMScheduler, LLMQueueFull, INTERACTIVE, EXTRACTION, current_priority
+from llm_policy import LLMCallPolicy, LLMDeadlineExceeded
+from metrics import STAGE_SECONDS, LLM_CALL_SECONDS, LLM_ERRORS, LLM_TOKENS, LLM_ESCALATIONS, SUMMARY_FALLBACKS
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Markdown code fence the model often wraps JSON answers in (```json ... ```)
+CODE_FENCE = re.compile(r"^\s*```[\w-]*[ \t]*\n?(.*?)\n?[ \t]*```\s*$", re.DOTALL)
+
 class ClinicalChatbot:
     """Clinical History Collection Chatbot"""
     
-    SECTIONS=[
-        "chief_complaint",
-        "present_illness",
-        "past_medical_history",
-        "medications",
-        "allergies",
-        "family_history",
-        "social_history",
-        "review_of_systems"
-    ]
+    SECTIONS = list(SESSION_SECTIONS)
     
     # Specific questions for each section based on question.txt
     SECTION_QUESTIONS = {
@@ -40,203 +52,481 @@ class ClinicalChatbot:
         "review_of_systems": "review_complete"  # Special marker for completion
     }
     
-    def __init__(self, api_key):
-        self.llm = ChatGoogleGenerativeAI(
-            model = "gemini-2.5-pro",
-            api_key = GOOGLE_API_KEY,
-            temperature = 0.4,
-            max_output_tokens = 2048
-        )
-        self.sessions = {}
+    # Field names and document headings that map to each section
+    SECTION_ALIASES = {
+        "chief_complaint": ["chief_complaint", "complaint", "reason", "reason_for_visit"],
+        "present_illness": ["present_illness", "current_illness", "hpi", "history_present_illness", "history_of_present_illness"],
+        "past_medical_history": ["past_medical_history", "medical_history", "pmh", "conditions", "past_conditions"],
+        "medications": ["medications", "current_medications", "meds", "drugs"],
+        "allergies": ["allergies", "drug_allergies", "allergic_to"],
+        "family_history": ["family_history", "family_medical_history", "fh"],
+        "social_history": ["social_history", "social", "sh", "lifestyle"],
+        "review_of_systems": ["review_of_systems", "ros", "systems_review"]
+    }
+    
+    # What the PDF extraction prompt asks the LLM to find for each section
+    PDF_SECTION_HINTS = {
+        "chief_complaint": "primary reason for visit",
+        "present_illness": "details about current illness",
+        "past_medical_history": "chronic conditions or past diagnoses",
+        "medications": "current medications with dosages",
+        "allergies": "known allergies",
+        "family_history": "family medical conditions",
+        "social_history": "smoking, alcohol, occupation, lifestyle",
+        "review_of_systems": "other symptoms or concerns"
+    }
+    
+    # Extracted values that mean "nothing found"
+    EMPTY_VALUES = ['null', 'none', 'n/a', 'not found']
+    
+    # Scheduler priority of each LLM call site (batch jobs override it via current_priority)
+    CALL_SITE_PRIORITY = {
+        "generate_summary": INTERACTIVE,
+        "stream_summary": INTERACTIVE,
+        "extract_from_pdf": EXTRACTION
+    }
+    
+    # Task whose model serves each LLM call site
+    LLM_TASKS = ["extraction", "summary", "conversation"]
+    CALL_SITE_TASK = {
+        "generate_summary": "summary",
+        "stream_summary": "summary",
+        "extract_from_pdf": "extraction"
+    }
+    
+    def __init__(self, api_key, summary_cache_size=256, summary_cache_ttl=3600, session_store=None,
+                 pdf_extractor=None, extraction_cache=None, pdf_chunked=True, pdf_chunk_tokens=750,
+                 pdf_chunk_concurrency=4, pdf_max_chunks=20, pdf_rule_extraction=True, llm=None,
+                 llm_scheduler=None, llm_policy=None, task_llms=None, escalation_llm=None, conversation_memory=None):
+        if llm is None:
+            api_key = api_key or GOOGLE_API_KEY
+            llm = create_llm("gemini", api_key=api_key)
+            if task_llms is None:
+                task_llms = {"extraction": create_llm("gemini", api_key=api_key, model=DEFAULT_MODELS["extraction"])}
+        # Any object with invoke/ainvoke/astream works, e.g. the local providers in llm_providers
+        self.llm = llm
+        # Per-task models (extraction, summary, conversation); tasks without one use llm
+        task_llms = task_llms or {}
+        self.task_llms = {task: task_llms[task] if task_llms.get(task) is not None else llm for task in self.LLM_TASKS}
+        # Answers from a task model that fail validation are asked again of this model
+        self.escalation_llm = escalation_llm if escalation_llm is not None else self.llm
+        # Global cap on concurrent LLM calls, serving interactive work before extraction and batch
+        self.llm_scheduler = llm_scheduler if llm_scheduler is not None else LLMScheduler()
+        # Per-call-site deadlines, budgeted retries and hedging around each LLM call
+        self.llm_policy = llm_policy if llm_policy is not None else LLMCallPolicy()
+        # Bounded store so abandoned sessions are evicted instead of leaking
+        self.sessions = session_store if session_store is not None else InMemorySessionStore()
+        # PDF parsing is CPU-bound, so it runs in worker processes
+        self.pdf_extractor = pdf_extractor if pdf_extractor is not None else PDFExtractor()
+        # Long PDFs are split into token-bounded chunks extracted concurrently
+        self.pdf_chunked = pdf_chunked
+        self.pdf_chunk_tokens = pdf_chunk_tokens
+        self.pdf_chunk_concurrency = max(1, pdf_chunk_concurrency)
+        self.pdf_max_chunks = pdf_max_chunks
+        # Heading-based extraction runs first; the LLM only handles sections it missed
+        self.pdf_rule_extraction = pdf_rule_extraction
+        self.heading_extractor = HeadingSectionExtractor(self.SECTION_ALIASES)
+        # JSON uploads are searched at any depth for the same aliases, compiled once
+        self.json_extractor = JSONSectionExtractor(self.SECTION_ALIASES)
+        # Extracted file data keyed by SHA-256 of the uploaded bytes
+        self.extraction_cache = extraction_cache if extraction_cache is not None else ExtractionCache()
+        # Refined summaries keyed by a hash of the section data they were built from
+        self.summary_cache = SummaryCache(summary_cache_size, summary_cache_ttl)
+        # Identical summaries or file extractions requested at the same time share one LLM call
+        self.summary_flights = SingleFlight("summary")
+        self.extraction_flights = SingleFlight("extraction")
+        # Static prompt text is rendered once here; calls only fill in per-session slots
+        self.prompts = PromptRegistry(self.SECTIONS, self.PDF_SECTION_HINTS)
+        # Conversation history kept under a token budget, older turns folded into a summary
+        self.memory = conversation_memory if conversation_memory is not None else ConversationMemory()
+        # Every assistant reply by (answered section index, negative answer), shared by all sessions
+        self.replies = {
+            (index, is_negative): share(self._build_reply(index, is_negative))
+            for index in range(len(self.SECTIONS)) for is_negative in (False, True)
+        }
         
     def create_session(self):
         """Create new conversation session"""
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
-            "section_index": 0,
-            "history": [],
-            "completed": False,
-            "awaiting_file_response": False,  # Track if waiting for file upload response
-            "section_data": {
-                "chief_complaint": None,
-                "present_illness": None,
-                "past_medical_history": "None reported",
-                "medications": "None reported",
-                "allergies": "No known allergies",
-                "family_history": "None reported",
-                "social_history": "None reported",
-                "review_of_systems": "No concerns reported"
-            }
-        }
+        self.sessions[session_id] = Session()
         return session_id
     
+    def _new_section_data(self):
+        """Section data with the defaults used for unanswered sections"""
+        return dict(zip(self.SECTIONS, SECTION_DEFAULTS))
+    
     def create_session_with_file_data(self, file_content, file_type: str):
         """Create session and pre-fill with data from uploaded file"""
         session_id = self.create_session()
         
         try:
-            print(f"[create_session_with_file_data] Processing {file_type} file")
+            logger.debug("Processing %s file", file_type, extra={"session_id": session_id})
             
-            if file_type == "json":
-                # file_content should be string for JSON
-                if isinstance(file_content, bytes):
-                    file_content = file_content.decode('utf-8')
-                print(f"[create_session_with_file_data] Extracting JSON data")
-                extracted_data = self._extract_from_json(file_content)
-            elif file_type == "pdf":
-                # file_content should be bytes for PDF
-                print(f"[create_session_with_file_data] Extracting PDF data")
-                extracted_data = self._extract_from_pdf(file_content)
-            else:
-                print(f"[create_session_with_file_data] Unsupported file type: {file_type}")
+            if file_type not in ("json", "pdf"):
+                logger.warning("Unsupported file type: %s", file_type, extra={"session_id": session_id})
                 return {"error": "Unsupported file type"}
             
-            print(f"[create_session_with_file_data] Extracted data type: {type(extracted_data)}")
+            extracted_data, metadata = self._extract_file_data(file_content, file_type)
+            return self._prefill_session(session_id, extracted_data, metadata)
             
-            # Ensure extracted_data is a dictionary
-            if not isinstance(extracted_data, dict):
-                error_msg = f"Extracted data is not a dictionary: {type(extracted_data)}"
-                print(f"[create_session_with_file_data] Error: {error_msg}")
-                return {"error": error_msg}
+        except LLMQueueFull:
+            self.sessions.pop(session_id, None)
+            raise
+        except Exception as e:
+            logger.exception("Failed to process %s file", file_type, extra={"session_id": session_id})
+            return {"error": f"Failed to process file: {str(e)}"}
+    
+    async def acreate_session_with_file_data(self, file_content, file_type: str):
+        """Async variant of create_session_with_file_data that never blocks the event loop"""
+        session_id = self.create_session()
+        
+        try:
+            logger.debug("Processing %s file", file_type, extra={"session_id": session_id})
             
-            print(f"[create_session_with_file_data] Extracted keys: {list(extracted_data.keys())}")
+            if file_type not in ("json", "pdf"):
+                logger.warning("Unsupported file type: %s", file_type, extra={"session_id": session_id})
+                return {"error": "Unsupported file type"}
             
-            # Check if extraction returned empty
-            if not extracted_data:
-                print(f"[create_session_with_file_data] No data extracted")
-                return {"error": "No medical data could be extracted from the file"}
+            extracted_data, metadata = await self._aextract_file_data(file_content, file_type)
+            return self._prefill_session(session_id, extracted_data, metadata)
             
-            # Pre-fill session data with extracted information
-            session = self.sessions[session_id]
-            for key, value in extracted_data.items():
-                if key in session["section_data"] and value:
-                    session["section_data"][key] = value
-                    # Advance section index for pre-filled sections
-                    if key != "chief_complaint" and key != "present_illness":
-                        session["section_index"] += 1
+        except LLMQueueFull:
+            self.sessions.pop(session_id, None)
+            raise
+        except Exception as e:
+            logger.exception("Failed to process %s file", file_type, extra={"session_id": session_id})
+            return {"error": f"Failed to process file: {str(e)}"}
+    
+    async def aanalyze_file(self, file_content, file_type: str):
+        """Extract data from a file and summarize it in one pass, without creating a session"""
+        try:
+            logger.debug("Processing %s file", file_type)
             
-            print(f"[create_session_with_file_data] Pre-filled {len(extracted_data)} sections")
+            if file_type not in ("json", "pdf"):
+                logger.warning("Unsupported file type: %s", file_type)
+                return {"error": "Unsupported file type"}
             
-            # Generate welcome message with pre-filled info
-            filled_sections = [k.replace('_', ' ').title() for k, v in extracted_data.items() if v]
-            welcome_msg = f"""Welcome! I've reviewed your uploaded medical records.
-
-I found information about: {', '.join(filled_sections) if filled_sections else 'some of your medical history'}.
-
-Let me ask you a few more questions to complete your clinical history.
-
-**What brings you to the doctor today?**"""
+            extracted_data, metadata = await self._aextract_file_data(file_content, file_type)
+            error = self._validate_extracted_data(extracted_data)
+            if error:
+                return {"error": error}
             
-            print(f"[create_session_with_file_data] Success - Session ID: {session_id}")
+            # Build the summary straight from the extraction instead of a stored session
+            section_data = self._new_section_data()
+            for key, value in extracted_data.items():
+                if key in section_data and value:
+                    section_data[key] = value
+            summary = await self._asummarize(section_data)
             
             return {
-                "session_id": session_id,
-                "welcome_message": welcome_msg,
-                "pre_filled_sections": filled_sections,
-                "extracted_data": extracted_data
+                "pre_filled_sections": [k.replace('_', ' ').title() for k, v in extracted_data.items() if v],
+                "extracted_data": extracted_data,
+                "summary": summary,
+                "metadata": metadata
             }
             
+        except LLMQueueFull:
+            raise
         except Exception as e:
-            print(f"[create_session_with_file_data] Exception: {type(e).__name__}: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Failed to process %s file", file_type)
             return {"error": f"Failed to process file: {str(e)}"}
     
-    def _extract_from_json(self, json_content: str) -> dict:
-        """Extract medical data from JSON file"""
+    def _extract_file_data(self, file_content, file_type: str):
+        """Extract section data from an upload, reusing the result for identical files"""
+        digest = file_hash(file_content)
+        key = self._extraction_key(digest)
+        extracted_data = self.extraction_cache.get(key)
+        cache_status = "miss" if extracted_data is None else "hit"
+        logger.debug("Extraction cache %s", cache_status, extra={"file_sha256": digest})
+        
+        if extracted_data is None:
+            extracted_data = self.extraction_flights.do(
+                key, lambda: self._extract_uncached(key, file_content, file_type)
+            )
+        
+        return extracted_data, {"file_sha256": digest, "extraction_cache": cache_status}
+    
+    def _extraction_key(self, digest):
+        """Extraction cache key of a file under the current model and PDF extraction settings"""
+        return extraction_key(digest, {
+            "model": model_name(self.task_llms["extraction"]),
+            "escalation_model": model_name(self.escalation_llm),
+            "rule_extraction": self.pdf_rule_extraction,
+            "chunked": self.pdf_chunked,
+            "chunk_tokens": self.pdf_chunk_tokens,
+            "max_chunks": self.pdf_max_chunks
+        })
+    
+    def _extract_uncached(self, key, file_content, file_type: str):
+        """Run the extraction for a cache miss and cache a usable result"""
+        if file_type == "json":
+            # file_content should be string or SpooledUpload for JSON
+            if isinstance(file_content, bytes):
+                file_content = file_content.decode('utf-8')
+            logger.debug("Extracting JSON data")
+            with STAGE_SECONDS.time(stage="json_extraction"):
+                extracted_data, complete = self._extract_from_json(file_content), True
+        else:
+            # file_content should be bytes for PDF
+            logger.debug("Extracting PDF data")
+            with STAGE_SECONDS.time(stage="pdf_extraction"):
+                extracted_data, complete = self._extract_from_pdf(file_content)
+        
+        # A raw-text fallback is not cached, so the next upload asks the LLM again
+        if complete and isinstance(extracted_data, dict) and extracted_data:
+            self.extraction_cache.set(key, extracted_data)
+        return extracted_data
+    
+    async def _aextract_file_data(self, file_content, file_type: str):
+        """Async variant of _extract_file_data"""
+        digest = file_hash(file_content)
+        key = self._extraction_key(digest)
+        extracted_data = self.extraction_cache.get(key)
+        cache_status = "miss" if extracted_data is None else "hit"
+        logger.debug("Extraction cache %s", cache_status, extra={"file_sha256": digest})
+        
+        if extracted_data is None:
+            extracted_data = await self.extraction_flights.ado(
+                key, lambda: self._aextract_uncached(key, file_content, file_type),
+                priority=self._llm_priority("extract_from_pdf")
+            )
+        
+        return extracted_data, {"file_sha256": digest, "extraction_cache": cache_status}
+    
+    async def _aextract_uncached(self, key, file_content, file_type: str):
+        """Async variant of _extract_uncached"""
+        if file_type == "json":
+            if isinstance(file_content, bytes):
+                file_content = file_content.decode('utf-8')
+            logger.debug("Extracting JSON data")
+            with STAGE_SECONDS.time(stage="json_extraction"):
+                # The key scan is CPU-bound on large files, so it runs off the event loop
+                extracted_data, complete = await asyncio.to_thread(self._extract_from_json, file_content), True
+        else:
+            logger.debug("Extracting PDF data")
+            with STAGE_SECONDS.time(stage="pdf_extraction"):
+                extracted_data, complete = await self._aextract_from_pdf(file_content)
+        
+        if complete and isinstance(extracted_data, dict) and extracted_data:
+            self.extraction_cache.set(key, extracted_data)
+        return extracted_data
+    
+    def _validate_extracted_data(self, extracted_data):
+        """Return an error message if extraction produced nothing usable"""
+        # Ensure extracted_data is a dictionary
+        if not isinstance(extracted_data, dict):
+            error_msg = f"Extracted data is not a dictionary: {type(extracted_data)}"
+            logger.warning(error_msg)
+            return error_msg
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Extracted keys: %s", list(extracted_data))
+        
+        # Check if extraction returned empty
+        if not extracted_data:
+            logger.info("No data extracted")
+            return "No medical data could be extracted from the file"
+        return None
+    
+    def _prefill_session(self, session_id, extracted_data, metadata=None):
+        """Validate extracted file data and pre-fill the session with it"""
+        error = self._validate_extracted_data(extracted_data)
+        if error:
+            return {"error": error}
+        
+        # Pre-fill session data with extracted information
+        session = self.sessions[session_id]
+        for key, value in extracted_data.items():
+            if key in SECTION_INDEX and value:
+                self._set_section(session, key, value)
+                # Advance section index for pre-filled sections
+                if key != "chief_complaint" and key != "present_illness":
+                    session.section_index += 1
+        self.sessions[session_id] = session
+        
+        logger.debug("Pre-filled %d sections", len(extracted_data), extra={"session_id": session_id})
+        
+        # Generate welcome message with pre-filled info
+        filled_sections = [k.replace('_', ' ').title() for k, v in extracted_data.items() if v]
+        welcome_msg = f"""Welcome! I've reviewed your uploaded medical records.
+
+I found information about: {', '.join(filled_sections) if filled_sections else 'some of your medical history'}.
+
+Let me ask you a few more questions to complete your clinical history.
+
+**What brings you to the doctor today?**"""
+        
+        logger.info("Created session from uploaded file", extra={"session_id": session_id})
+        
+        return {
+            "session_id": session_id,
+            "welcome_message": welcome_msg,
+            "pre_filled_sections": filled_sections,
+            "extracted_data": extracted_data,
+            "metadata": metadata or {}
+        }
+    
+    def _extract_from_json(self, json_content) -> dict:
+        """Extract medical data from a JSON string or SpooledUpload, streaming large files"""
+        if isinstance(json_content, SpooledUpload):
+            with json_content.text() as stream:
+                return self.json_extractor.extract(stream)
+        
+        # Ensure json_content is a string
+        if not isinstance(json_content, str):
+            raise ValueError(f"JSON content must be string, got {type(json_content)}")
+        return self.json_extractor.extract(json_content)
+    
+    def _extract_from_pdf(self, pdf_content: bytes):
+        """Extract and parse medical data from PDF file
+        
+        Returns (data, complete); complete is False when the raw-text fallback was used.
+        """
         try:
-            # Ensure json_content is a string
-            if not isinstance(json_content, str):
-                raise ValueError(f"JSON content must be string, got {type(json_content)}")
-            
-            data = json.loads(json_content)
+            with STAGE_SECONDS.time(stage="pdf_text"):
+                text = self.pdf_extractor.extract_text(pdf_content)
+            found, prompts = self._plan_pdf_extraction(text)
+            if not prompts:
+                return self._combine_pdf_extractions(found, [], text)
             
-            # Ensure parsed data is a dictionary
-            if not isinstance(data, dict):
-                raise ValueError(f"JSON must contain an object/dictionary, got {type(data)}")
-            
-            # Map common JSON keys to our section structure
-            extracted = {}
-            
-            # Map various possible JSON field names to our sections
-            key_mappings = {
-                "chief_complaint": ["chief_complaint", "complaint", "reason", "reason_for_visit"],
-                "present_illness": ["present_illness", "current_illness", "hpi", "history_present_illness"],
-                "past_medical_history": ["past_medical_history", "medical_history", "pmh", "conditions", "past_conditions"],
-                "medications": ["medications", "current_medications", "meds", "drugs"],
-                "allergies": ["allergies", "drug_allergies", "allergic_to"],
-                "family_history": ["family_history", "family_medical_history", "fh"],
-                "social_history": ["social_history", "social", "sh", "lifestyle"],
-                "review_of_systems": ["review_of_systems", "ros", "systems_review"]
-            }
-            
-            for section, possible_keys in key_mappings.items():
-                for key in possible_keys:
-                    if key in data:
-                        value = data[key]
-                        # Handle lists (e.g., medications as array)
-                        if isinstance(value, list):
-                            extracted[section] = ", ".join(str(v) for v in value)
-                        elif isinstance(value, dict):
-                            extracted[section] = json.dumps(value, indent=2)
-                        else:
-                            extracted[section] = str(value)
-                        break
-            
-            return extracted
-            
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON format: {str(e)}")
+            # Use LLM to parse medical information from each chunk
+            with ThreadPoolExecutor(max_workers=self.pdf_chunk_concurrency) as pool:
+                contents = list(pool.map(
+                    lambda prompt: self._invoke_llm("extract_from_pdf", prompt, self._valid_pdf_extraction).content,
+                    prompts
+                ))
+            return self._combine_pdf_extractions(found, contents, text)
+                
+        except LLMQueueFull:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to parse PDF: {str(e)}")
     
-    def _extract_from_pdf(self, pdf_content: bytes) -> dict:
-        """Extract and parse medical data from PDF file"""
+    async def _aextract_from_pdf(self, pdf_content: bytes):
+        """Async variant of _extract_from_pdf using the LLM's ainvoke"""
         try:
-            # Ensure pdf_content is bytes
-            if isinstance(pdf_content, str):
-                raise ValueError("PDF content must be bytes, not string")
+            with STAGE_SECONDS.time(stage="pdf_text"):
+                text = await self.pdf_extractor.aextract_text(pdf_content)
+            found, prompts = self._plan_pdf_extraction(text)
+            if not prompts:
+                return self._combine_pdf_extractions(found, [], text)
             
-            # Read PDF content
-            from io import BytesIO
-            pdf_file = BytesIO(pdf_content)
-            reader = PdfReader(pdf_file)
-            
-            # Extract all text from PDF
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            
-            # Use LLM to parse medical information from text
-            parse_prompt = f"""Extract medical information from this document and structure it into these categories. Return ONLY valid JSON with no additional text:
-
-Document text:
-{text[:3000]}  
-
-Extract and return as JSON with these exact keys (use null if information not found):
-{{
-    "chief_complaint": "primary reason for visit",
-    "present_illness": "details about current illness",
-    "past_medical_history": "chronic conditions or past diagnoses",
-    "medications": "current medications with dosages",
-    "allergies": "known allergies",
-    "family_history": "family medical conditions",
-    "social_history": "smoking, alcohol, occupation, lifestyle",
-    "review_of_systems": "other symptoms or concerns"
-}}"""
+            semaphore = asyncio.Semaphore(self.pdf_chunk_concurrency)
             
-            response = self.llm.invoke(parse_prompt)
+            async def extract_chunk(prompt):
+                async with semaphore:
+                    response = await self._ainvoke_llm("extract_from_pdf", prompt, self._valid_pdf_extraction)
+                    return response.content
             
-            # Parse LLM response as JSON
-            try:
-                extracted_data = json.loads(response.content)
-                # Filter out null values
-                return {k: v for k, v in extracted_data.items() if v and v.lower() not in ['null', 'none', 'n/a', 'not found']}
-            except json.JSONDecodeError:
-                # If LLM didn't return valid JSON, return the raw text
-                return {"past_medical_history": text[:500] + "..."}
+            contents = await asyncio.gather(*(extract_chunk(prompt) for prompt in prompts))
+            return self._combine_pdf_extractions(found, contents, text)
                 
+        except LLMQueueFull:
+            raise
         except Exception as e:
             raise ValueError(f"Failed to parse PDF: {str(e)}")
     
+    def _plan_pdf_extraction(self, text: str):
+        """Run the heading extractor and build LLM prompts for the sections it missed"""
+        found = self.heading_extractor.extract(text) if self.pdf_rule_extraction else {}
+        missing = [section for section in self.SECTIONS if section not in found]
+        if not missing:
+            logger.debug("All sections found under headings, skipping LLM")
+            return found, []
+        
+        logger.debug("Headings found %d sections, asking LLM for %d", len(found), len(missing))
+        return found, [self._build_pdf_parse_prompt(chunk, missing) for chunk in self._pdf_chunks(text)]
+    
+    def _combine_pdf_extractions(self, found: dict, contents: list, text: str):
+        """Merge heading-based values with LLM results for the remaining sections
+        
+        Returns (data, complete); complete is False when no LLM answer was valid
+        JSON and the raw-text fallback was used.
+        """
+        extracted = {k: v for k, v in found.items() if v.lower() not in self.EMPTY_VALUES}
+        complete = True
+        if contents:
+            merged = self._merge_pdf_extractions(contents)
+            if merged is None:
+                # If LLM didn't return valid JSON, return the raw text
+                logger.warning("No valid JSON in %d extraction answers, using raw text", len(contents))
+                merged = {"past_medical_history": text[:500] + "..."}
+                complete = False
+            for key, value in merged.items():
+                if key not in found:
+                    extracted[key] = value
+        return {section: extracted[section] for section in self.SECTIONS if section in extracted}, complete
+    
+    def _pdf_chunks(self, text: str) -> list:
+        """Split PDF text into the pieces sent to the LLM for extraction"""
+        if not self.pdf_chunked:
+            return [text[:3000]]
+        
+        chunks = chunk_text(text, self.pdf_chunk_tokens)
+        if len(chunks) > self.pdf_max_chunks:
+            logger.info("Document has %d chunks, extracting the first %d", len(chunks), self.pdf_max_chunks)
+            chunks = chunks[:self.pdf_max_chunks]
+        return chunks or [text]
+    
+    def _build_pdf_parse_prompt(self, text: str, sections=None) -> str:
+        """Build the LLM prompt that structures PDF text into the given sections"""
+        return self.prompts.pdf_parse(text, sections)
+    
+    def _valid_summary(self, content: str) -> bool:
+        """Whether a summary answer has any text, so no escalation is needed"""
+        return bool(content.strip())
+    
+    def _parse_pdf_extraction(self, content: str):
+        """Parse one LLM JSON answer into non-empty section values, or None if invalid"""
+        fenced = CODE_FENCE.match(content)
+        if fenced:
+            content = fenced.group(1)
+        try:
+            extracted_data = json.loads(content)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(extracted_data, dict):
+            return None
+        
+        parsed = {}
+        for key, value in extracted_data.items():
+            if isinstance(value, list):
+                value = ", ".join(str(v) for v in value)
+            elif isinstance(value, dict):
+                value = json.dumps(value)
+            elif value is not None:
+                value = str(value)
+            # Filter out null values
+            if value and value.strip().lower() not in self.EMPTY_VALUES:
+                parsed[key] = value.strip()
+        return parsed
+    
+    def _valid_pdf_extraction(self, content: str) -> bool:
+        """Whether an extraction answer is a JSON object, so no escalation is needed"""
+        return self._parse_pdf_extraction(content) is not None
+    
+    def _merge_pdf_extractions(self, contents: list):
+        """Merge per-chunk extractions in document order, dropping repeated values
+        
+        Returns None when no answer is valid JSON.
+        """
+        parsed = [p for p in (self._parse_pdf_extraction(c) for c in contents) if p is not None]
+        if not parsed:
+            return None
+        
+        merged = {}
+        for section in self.SECTIONS:
+            values = []
+            seen = set()
+            for chunk_data in parsed:
+                value = chunk_data.get(section)
+                if value and value.lower() not in seen:
+                    seen.add(value.lower())
+                    values.append(value)
+            if values:
+                merged[section] = "; ".join(values)
+        return merged
+    
     def get_welcome_message(self):
         """Return welcome message"""
         return """Welcome! I'm DocAI, your clinical history assistant.
@@ -249,7 +539,8 @@ I'll ask you 7 key questions to build your Electronic Health Record.
     
     def get_response(self, session_id, user_message):
         """Get chatbot response"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if session is None:
             return {"error": "Invalid session"}
         
         # Input validation - check if message is empty or only whitespace
@@ -269,13 +560,18 @@ I'll ask you 7 key questions to build your Electronic Health Record.
                 "requires_input": True
             }
         
-        session = self.sessions[session_id]
-        
+        response = self._process_answer(session, user_message)
+        # Write back so external session stores see the updated state
+        self.sessions[session_id] = session
+        return response
+    
+    def _process_answer(self, session, user_message):
+        """Apply a validated patient answer to the session and build the reply"""
         # Handle file upload response
-        if session.get("awaiting_file_response", False):
+        if session.awaiting_file_response:
             user_lower = user_message.lower().strip()
             if any(word in user_lower for word in ["yes", "yeah", "sure", "ok", "okay", "yep"]):
-                session["awaiting_file_response"] = False
+                session.awaiting_file_response = False
                 return {
                     "message": "Great! Please upload your medical file (PDF or JSON format) using the file upload feature in the interface.",
                     "progress": 100,
@@ -283,8 +579,8 @@ I'll ask you 7 key questions to build your Electronic Health Record.
                     "awaiting_file": True
                 }
             elif any(word in user_lower for word in ["no", "nope", "nah", "not"]):
-                session["awaiting_file_response"] = False
-                session["completed"] = True
+                session.awaiting_file_response = False
+                session.completed = True
                 return {
                     "message": "No problem! Your clinical history collection is complete. This information will be available for your doctor to review.",
                     "progress": 100,
@@ -299,10 +595,10 @@ I'll ask you 7 key questions to build your Electronic Health Record.
                 }
         
         # Add to history
-        session["history"].append(f"Patient: {user_message}")
+        self.memory.add(session, PATIENT, user_message)
         
         # Get current section
-        section_index = min(session["section_index"], len(self.SECTIONS)-1)
+        section_index = min(session.section_index, len(self.SECTIONS)-1)
         current_section = self.SECTIONS[section_index]
         
         # Check if user says "no", "none", "not applicable" etc.
@@ -313,21 +609,41 @@ I'll ask you 7 key questions to build your Electronic Health Record.
         # Store the response data
         if not is_negative:
             # User provided actual information
-            session["section_data"][current_section] = user_message
+            self._set_section(session, current_section, user_message)
         # else: keep the default "None reported" value
         
-        # Generate empathetic acknowledgment
-        acknowledgment = self._generate_acknowledgment(current_section, user_message, is_negative)
+        # Acknowledgment plus the next question, or the closing message
+        response = self.replies[(section_index, is_negative)]
+        self.memory.add(session, ASSISTANT, response)
         
         # Advance to next section
-        session["section_index"] += 1
+        session.section_index += 1
         
         # Check if all sections are complete
-        if session["section_index"] >= len(self.SECTIONS):
+        if session.section_index >= len(self.SECTIONS):
             # All 7 sections complete - mark as completed and ask about file
-            session["completed"] = True  # Mark conversation as complete
-            session["awaiting_file_response"] = True  # Optional file upload step
-            thank_you_message = f"""{acknowledgment}
+            session.completed = True  # Mark conversation as complete
+            session.awaiting_file_response = True  # Optional file upload step
+            return {
+                "message": response,
+                "progress": 100,
+                "completed": True,  # Conversation is complete for summary generation
+                "awaiting_file_response": True  # But still waiting for optional file upload response
+            }
+        
+        return {
+            "message": response,
+            "progress": int((session.section_index / len(self.SECTIONS)) * 100),
+            "completed": False
+        }
+    
+    def _build_reply(self, section_index, is_negative):
+        """Assistant reply to an answer for the section at section_index"""
+        # Generate empathetic acknowledgment
+        acknowledgment = self._generate_acknowledgment(self.SECTIONS[section_index], None, is_negative)
+        
+        if section_index + 1 >= len(self.SECTIONS):
+            return f"""{acknowledgment}
 
 **🎉 Thank you so much for providing all this information!**
 
@@ -343,29 +659,17 @@ I've collected all 7 key details for your Electronic Health Record:
 This comprehensive information will help your doctor provide you with the best possible care during your consultation.
 
 **Would you like to upload any additional medical records (PDF or JSON format) to supplement this information?**"""
-            
-            session["history"].append(f"Assistant: {thank_you_message}")
-            
-            return {
-                "message": thank_you_message,
-                "progress": 100,
-                "completed": True,  # Conversation is complete for summary generation
-                "awaiting_file_response": True  # But still waiting for optional file upload response
-            }
         
         # Get next question
-        next_section = self.SECTIONS[session["section_index"]]
-        next_question = self.SECTION_QUESTIONS[next_section]
-        
-        response = f"{acknowledgment}\n\n**{next_question}**"
-        
-        session["history"].append(f"Assistant: {response}")
-        
-        return {
-            "message": response,
-            "progress": int((session["section_index"] / len(self.SECTIONS)) * 100),
-            "completed": False
-        }
+        next_question = self.SECTION_QUESTIONS[self.SECTIONS[section_index + 1]]
+        return f"{acknowledgment}\n\n**{next_question}**"
+    
+    def _set_section(self, session, section, value):
+        """Update a section, invalidating the cached summary if the data changes"""
+        if session.get_section(section) == value:
+            return
+        self.summary_cache.invalidate(section_data_hash(session.section_data))
+        session.set_section(section, value)
     
     def _generate_acknowledgment(self, section, user_message, is_negative):
         """Generate empathetic acknowledgment based on the section and response"""
@@ -393,166 +697,225 @@ This comprehensive information will help your doctor provide you with the best p
         return acknowledgments.get(section, "Thank you for that information.")
         
     def _create_chain(self, session):
-        """Create LangChain conversation chain with system prompt"""
-        current_section = self.SECTIONS[min(session["section_index"], len(self.SECTIONS)-1)]
-        
-        sys_prompt = f"""
-        You are DocAI, a specialized AI assistant for Pre-Consultation Clinical History Collection. Your persona is that of a professional, empathetic, and highly accurate medical scribe or nurse.
-
-        Your primary and ONLY purpose is to interactively gather a patient's complete clinical history and family clinical history before their consultation with a doctor.
-        
-        **Core Directives:**
-        1. **Be Medically Systematic**: Your questioning must be medically accurate and structured. When a patient mentions a symptom (especially a chief complaint), methodologically ask follow-up questions based on standard clinical protocols (like OPQRST for pain: Onset, Palliating/Provoking factors, Quality, Radiation, Severity, Timing). Your goal is to get a complete picture of the 'History of Present Illness'.
-        
-        2. **Be Comprehensive**: After addressing the chief complaint, you must proactively ask about other key areas:
-            - Past Medical History (e.g., "Do you have any ongoing conditions like diabetes, or high blood pressure?")
-            - Past Surgical History (e.g., "Have you had any surgeries in the past?")
-            - Current Medications (e.g., "Are you currently taking any prescription medications, over-the-counter drugs, or supplements?")
-            - Allergies (e.g., "Do you have any allergies to medications, food or anything else?")
-            - Family Clinical History (e.g., "Does anyone in your immediate family have signficant medical conditions like heart disease, cancer, or diabetes?")
-            
-        3. **Accept "No" Responses**: If a patient says "no", "none", "not applicable", or similar for any section, accept it gracefully and move to the next section. Do NOT push for more information if they clearly state they have nothing to report.
-            - Example: If they say "No allergies", respond with "Got it, no known allergies. That's noted." and proceed.
-            - Example: If they say "I don't take any medications", respond with "Understood, no current medications. Thank you."
-            
-        4. **Handle Vague Prompts**: If a patient's input is vague (e.g., "I feel sick", "I'm not well"), you MUST take initiative. Do not say "I don't understand." Instead, guide them with gentle, clarifying questions.
-            - Example for "I feel sick": "I'm very sorry to hear that. To help me understand, could you tell me more about what's bothering you most? For example, is it pain, nausea, dizziness, or something else?"
-            - Example for "I don't know": "That's perfectly okay. We can take this one step at a time. Let's start with the main reason you're looking to speak with the doctor today. Can you describe it in your own words?"
-            
-        5. **Be Empathetic**: Use a reassuring and patient tone. Acknowledge the patient's feelings.
-            - Example: "I understand that must be very uncomfortable for you."
-            - Example: "Thank you for sharing that. That's very helpful information for the doctor."
-            
-        **CRITICAL SAFETY CONSTRAINT: DO NOT DIAGNOSE OR ADVISE**
-        
-        You MUST NOT, under any circumstances, provide a medical diagnosis, medical advice, or treatment recommendations.
-        You MUST NOT interpret symptoms or suggest possible causes.
-        
-        If the user asks for advice, a diagnosis, or what their symptoms mean (e.g., "What do you think I have?", "Is this serious?", "What should I do?"), you MUST decline and state your purpose.
-        
-        **Mandatory Response**: "I am an AI assistant designed only to collect your medical history for the doctor. I cannot provide any diagnosis or medical advice. Please be sure to discuss all your concerns, including this question, with the clinician."
-        
-        **Current Focus Area**: {current_section.replace('_', ' ').title()}
-        
-        Your final output from this conversation will be used to create a structured summary for the doctor. Focus on being a clear, precise and empathetic interviewer."""
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", sys_prompt),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}")
-        ])
-        
-        # Create message history
-        message_history = InMemoryChatMessageHistory()
-        
-        # Load last few messages into memory
-        for msg in session["history"][-6:]:
-            if "Patient:" in msg:
-                message_history.add_message(HumanMessage(content=msg.replace("Patient: ", "")))
-            else:
-                message_history.add_message(AIMessage(content=msg.replace("Assistant: ", "")))
-        
-        # Create a simple chain that formats the prompt with history and invokes the LLM
-        class SimpleConversationChain:
-            def __init__(self, llm, prompt, message_history):
-                self.llm = llm
-                self.prompt = prompt
-                self.message_history = message_history
-            
-            def predict(self, input):
-                messages = self.prompt.format_messages(
-                    history=self.message_history.messages,
-                    input=input
-                )
-                response = self.llm.invoke(messages)
-                return response.content
-        
-        return SimpleConversationChain(self.llm, prompt, message_history)
+        """Conversation chain for the session's current section and token-budgeted memory"""
+        return self.prompts.conversation_chain(self.task_llms["conversation"], session.current_section, session)
     
     def generate_summary(self, session_id):
         """Generate polished, professional doctor summary using LLM"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if session is None:
             return "No sessions found"
         
-        session = self.sessions[session_id]
-        section_data = session["section_data"]
+        return self._summarize(session.section_data)
+    
+    async def agenerate_summary(self, session_id):
+        """Async variant of generate_summary using the LLM's ainvoke"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return "No sessions found"
         
-        # Create prompt for LLM to refine the summary
-        refinement_prompt = f"""You are a medical scribe creating a professional Electronic Health Record (EHR) summary for a physician. 
-
-Based on the patient's responses below, create a polished, concise, and clinically appropriate summary. Follow these guidelines:
-
-1. Use professional medical terminology where appropriate
-2. Remove conversational language and filler words
-3. Write in complete, clear sentences using third person ("Patient reports...", "Patient denies...")
-4. Keep information factual and objective
-5. Organize information logically within each section
-6. Use abbreviations common in medical records (e.g., "y/o" for years old, "Hx" for history)
-7. If patient said "no/none", write standard medical phrases like "Denies...", "None reported", "No known..."
-
-**Raw Patient Responses:**
-
-Chief Complaint: {section_data.get("chief_complaint", "Not specified")}
-
-History of Present Illness: {section_data.get("present_illness", "Not specified")}
-
-Past Medical History: {section_data.get("past_medical_history", "None reported")}
-
-Current Medications: {section_data.get("medications", "None reported")}
-
-Allergies: {section_data.get("allergies", "No known allergies")}
-
-Family History: {section_data.get("family_history", "None reported")}
-
-Social History: {section_data.get("social_history", "None reported")}
-
-Review of Systems: {section_data.get("review_of_systems", "No concerns reported")}
-
----
-
-Generate a professional clinical summary following this EXACT format:
-
-**ELECTRONIC HEALTH RECORD - CLINICAL SUMMARY**
-Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}
-
-**CHIEF COMPLAINT:**
-[Refined, concise statement of primary concern]
-
-**HISTORY OF PRESENT ILLNESS:**
-[Professional narrative of current condition with timeline, symptoms, and progression]
-
-**PAST MEDICAL HISTORY:**
-[Organized list or statement of chronic conditions, past diagnoses]
-
-**CURRENT MEDICATIONS:**
-[Professional format of medications - if available include dosage/frequency]
-
-**ALLERGIES:**
-[Standard allergy documentation format]
-
-**FAMILY HISTORY:**
-[Relevant family medical conditions]
-
-**SOCIAL HISTORY:**
-[Professionally stated social factors]
-
-**REVIEW OF SYSTEMS:**
-[Clinical documentation of other symptoms or "All other systems reviewed and negative"]
-
----
-**Prepared for physician review**
-
-IMPORTANT: Return ONLY the formatted clinical summary. Do not add any explanations, comments, or extra text."""
-
+        return await self._asummarize(session.section_data)
+    
+    def _summarize(self, section_data):
+        """Refine section data into a summary, served from the cache when unchanged"""
+        cache_key = section_data_hash(section_data)
+        cached = self.summary_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Concurrent requests for the same section data share one LLM call
+        return self.summary_flights.do(cache_key, lambda: self._refine_summary(section_data, cache_key))
+    
+    def _refine_summary(self, section_data, cache_key):
+        """Ask the LLM for the refined summary, falling back to the template on failure"""
         try:
             # Use LLM to refine the summary
-            response = self.llm.invoke(refinement_prompt)
+            response = self._invoke_llm("generate_summary", self._build_summary_prompt(section_data), self._valid_summary)
             refined_summary = response.content.strip()
+            self.summary_cache.set(cache_key, refined_summary)
             return refined_summary
             
+        except LLMQueueFull:
+            raise
         except Exception as e:
             # Fallback to basic summary if LLM fails
-            return f"""**ELECTRONIC HEALTH RECORD - CLINICAL SUMMARY**
+            return self._fallback_summary(section_data, e)
+    
+    async def _asummarize(self, section_data):
+        """Async variant of _summarize"""
+        cache_key = section_data_hash(section_data)
+        cached = self.summary_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        return await self.summary_flights.ado(
+            cache_key, lambda: self._arefine_summary(section_data, cache_key),
+            priority=self._llm_priority("generate_summary")
+        )
+    
+    async def _arefine_summary(self, section_data, cache_key):
+        """Async variant of _refine_summary"""
+        try:
+            response = await self._ainvoke_llm("generate_summary", self._build_summary_prompt(section_data), self._valid_summary)
+            refined_summary = response.content.strip()
+            self.summary_cache.set(cache_key, refined_summary)
+            return refined_summary
+            
+        except LLMQueueFull:
+            raise
+        except Exception as e:
+            return self._fallback_summary(section_data, e)
+    
+    async def astream_summary(self, session_id):
+        """Stream the refined summary as it is generated
+        
+        Yields ("token", text) chunks from the LLM's streaming interface. If the
+        model fails mid-stream or misses the stream_summary first-token or total
+        deadline, a single ("fallback", summary) event carries the template
+        summary, which replaces anything streamed so far; so does a stream that
+        ends without any text. Only a valid summary is cached.
+        """
+        section_data = self.sessions[session_id].section_data
+        cache_key = section_data_hash(section_data)
+        cached = self.summary_cache.get(cache_key)
+        if cached is not None:
+            yield "token", cached
+            return
+        
+        # The slot is held for the whole stream; LLMQueueFull is raised before the first event
+        llm = self.task_llms[self.CALL_SITE_TASK["stream_summary"]]
+        prompt = self._build_summary_prompt(section_data)
+        async with self.llm_scheduler.aslot(self._llm_priority("stream_summary")):
+            chunks = []
+            start = time.perf_counter()
+            try:
+                async for chunk in self.llm_policy.astream("stream_summary", llm.astream(prompt)):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield "token", chunk.content
+            except LLMDeadlineExceeded as e:
+                # A stalled stream would otherwise keep its interactive slot
+                logger.warning("%s", e)
+                yield "fallback", self._fallback_summary(section_data, e)
+                return
+            except Exception as e:
+                LLM_ERRORS.inc(call_site="stream_summary")
+                yield "fallback", self._fallback_summary(section_data, e)
+                return
+            finally:
+                LLM_CALL_SECONDS.observe(time.perf_counter() - start, call_site="stream_summary", model=model_name(llm))
+        
+        summary = "".join(chunks).strip()
+        self._count_tokens(llm, prompt, summary)
+        if not self._valid_summary(summary):
+            # Nothing usable was streamed; send the template and keep it out of the cache
+            yield "fallback", self._fallback_summary(section_data, ValueError("empty summary"))
+            return
+        self.summary_cache.set(cache_key, summary)
+    
+    def _llm_priority(self, call_site):
+        """Scheduler priority for a call site, unless the caller set current_priority
+        
+        Inside a shared call this is its SharedPriority, which the scheduler accepts too.
+        """
+        priority = current_priority.get()
+        return priority if priority is not None else self.CALL_SITE_PRIORITY[call_site]
+    
+    def _invoke_llm(self, call_site, prompt, validate=None):
+        """Call the call site's task model, escalating answers that fail validate
+        
+        When validate(content) is false and the task model is not already the
+        escalation model, the prompt is sent once more to the escalation model
+        and its answer is returned whatever it contains.
+        """
+        llm = self.task_llms[self.CALL_SITE_TASK[call_site]]
+        response = self._call_model(call_site, llm, prompt)
+        if validate is None or llm is self.escalation_llm or validate(response.content):
+            return response
+        
+        logger.info("%s answer from %s failed validation, escalating to %s",
+                    call_site, model_name(llm), model_name(self.escalation_llm))
+        LLM_ESCALATIONS.inc(call_site=call_site)
+        return self._call_model(call_site, self.escalation_llm, prompt)
+    
+    async def _ainvoke_llm(self, call_site, prompt, validate=None):
+        """Async variant of _invoke_llm"""
+        llm = self.task_llms[self.CALL_SITE_TASK[call_site]]
+        response = await self._acall_model(call_site, llm, prompt)
+        if validate is None or llm is self.escalation_llm or validate(response.content):
+            return response
+        
+        logger.info("%s answer from %s failed validation, escalating to %s",
+                    call_site, model_name(llm), model_name(self.escalation_llm))
+        LLM_ESCALATIONS.inc(call_site=call_site)
+        return await self._acall_model(call_site, self.escalation_llm, prompt)
+    
+    def _call_model(self, call_site, llm, prompt):
+        """Call llm under the call site's deadline and retry policy
+        
+        Each attempt waits for a scheduler slot and records its duration,
+        errors and token usage under call_site and the model.
+        """
+        priority = self._llm_priority(call_site)
+        model = model_name(llm)
+        
+        def attempt():
+            with self.llm_scheduler.slot(priority):
+                try:
+                    with LLM_CALL_SECONDS.time(call_site=call_site, model=model):
+                        response = llm.invoke(prompt)
+                except Exception:
+                    LLM_ERRORS.inc(call_site=call_site)
+                    raise
+            self._count_tokens(llm, prompt, response)
+            return response
+        
+        return self.llm_policy.call(call_site, attempt)
+    
+    async def _acall_model(self, call_site, llm, prompt):
+        """Async variant of _call_model"""
+        priority = self._llm_priority(call_site)
+        model = model_name(llm)
+        
+        async def attempt():
+            async with self.llm_scheduler.aslot(priority):
+                try:
+                    with LLM_CALL_SECONDS.time(call_site=call_site, model=model):
+                        response = await llm.ainvoke(prompt)
+                except Exception:
+                    LLM_ERRORS.inc(call_site=call_site)
+                    raise
+            self._count_tokens(llm, prompt, response)
+            return response
+        
+        return await self.llm_policy.acall(call_site, attempt)
+    
+    def _count_tokens(self, llm, prompt, response):
+        """Add a call's input and output tokens to the per-model totals
+        
+        Uses the usage the provider reports, otherwise estimates from the
+        text length. response may be a message or the streamed text.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        else:
+            prompt_text = prompt if isinstance(prompt, str) else "".join(str(m.content) for m in prompt)
+            output_text = response if isinstance(response, str) else str(response.content)
+            input_tokens = len(prompt_text) // CHARS_PER_TOKEN
+            output_tokens = len(output_text) // CHARS_PER_TOKEN
+        model = model_name(llm)
+        LLM_TOKENS.inc(input_tokens, model=model, direction="input")
+        LLM_TOKENS.inc(output_tokens, model=model, direction="output")
+    
+    def _build_summary_prompt(self, section_data):
+        """Build the EHR refinement prompt from collected section data"""
+        return self.prompts.summary(section_data)
+    
+    def _fallback_summary(self, section_data, error):
+        """Template summary used when the LLM refinement fails"""
+        SUMMARY_FALLBACKS.inc()
+        return f"""**ELECTRONIC HEALTH RECORD - CLINICAL SUMMARY**
 Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}
 
 **CHIEF COMPLAINT:**
@@ -580,5 +943,5 @@ Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}
 {section_data.get("review_of_systems", "No concerns reported")}
 
 ---
-**Note:** Error generating refined summary: {str(e)}
+**Note:** Error generating refined summary: {str(error)}
 """
\ No newline at end of file
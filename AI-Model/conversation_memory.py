@@ -0,0 +1,82 @@
+import logging
+from pdf_extraction import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+PATIENT = "patient"
+ASSISTANT = "assistant"
+
+# Separates the patient statements folded into the running summary
+SUMMARY_SEPARATOR = " | "
+
+
+def estimate_tokens(text):
+    """Token estimate from text length, the same heuristic used to size PDF chunks"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def extractive_summary(summary, evicted):
+    """Fold evicted (role, content, tokens) messages into the running summary
+
+    The assistant's turns are the fixed acknowledgments and section questions,
+    so only what the patient said is kept, each statement clipped to 300
+    characters.
+    """
+    statements = [content[:300] for role, content, _ in evicted if role == PATIENT]
+    if not statements:
+        return summary
+    return SUMMARY_SEPARATOR.join(([summary] if summary else []) + statements)
+
+
+class ConversationMemory:
+    """Token-budgeted conversation history with a rolling summary of older turns
+
+    The memory lives on the Session: typed (role, content, tokens) messages,
+    their token total and a summary of the turns that no longer fit. Once
+    the recent messages and the summary exceed max_tokens, the oldest
+    messages are folded into the summary by summarize until the messages
+    fit in max_tokens - summary_tokens again, and the summary keeps only its
+    newest summary_tokens worth of text. Prompts built from the memory
+    therefore never exceed max_tokens, however long the conversation runs.
+    """
+
+    def __init__(self, max_tokens=1000, summary_tokens=250, summarize=extractive_summary):
+        self.max_tokens = max_tokens
+        self.summary_tokens = min(summary_tokens, max_tokens // 2)
+        self.summarize = summarize
+
+    def add(self, session, role, content):
+        """Append a message, compacting older turns when over budget"""
+        # A single message may use whatever the summary does not
+        max_chars = (self.max_tokens - self.summary_tokens) * CHARS_PER_TOKEN
+        content = content[:max_chars]
+        tokens = estimate_tokens(content)
+        session.messages.append((role, content, tokens))
+        session.memory_tokens += tokens
+        if self.prompt_tokens(session) > self.max_tokens:
+            self._compact(session)
+
+    def _compact(self, session):
+        messages = session.messages
+        target = self.max_tokens - self.summary_tokens
+        evicted = 0
+        while len(messages) - evicted > 1 and session.memory_tokens > target:
+            session.memory_tokens -= messages[evicted][2]
+            evicted += 1
+        if evicted:
+            session.summary = self._clip_summary(self.summarize(session.summary, messages[:evicted]))
+            del messages[:evicted]
+            logger.debug("Folded %d messages into the conversation summary", evicted)
+
+    def _clip_summary(self, summary):
+        """Keep the newest part of the summary, starting at a statement boundary"""
+        max_chars = self.summary_tokens * CHARS_PER_TOKEN
+        if len(summary) <= max_chars:
+            return summary
+        clipped = summary[-max_chars:]
+        boundary = clipped.find(SUMMARY_SEPARATOR)
+        return clipped[boundary + len(SUMMARY_SEPARATOR):] if boundary != -1 else clipped
+
+    def prompt_tokens(self, session):
+        """Tokens the memory adds to a prompt"""
+        return session.memory_tokens + estimate_tokens(session.summary)
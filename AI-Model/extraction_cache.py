@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from uploads import SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(file_content):
+    """SHA-256 of uploaded file content (text is hashed as UTF-8)"""
+    if isinstance(file_content, SpooledUpload):
+        # Computed while the upload was read
+        return file_content.sha256
+    if isinstance(file_content, str):
+        file_content = file_content.encode("utf-8")
+    return hashlib.sha256(file_content).hexdigest()
+
+
+def extraction_key(digest, settings):
+    """Cache key for a file's extraction under the settings that produced it
+
+    settings is a JSON-serializable dict (model, extraction mode, ...); the
+    key starts with the file digest, followed by a short hash of settings.
+    """
+    version = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return f"{digest}-{version}"
+
+
+class ExtractionCache:
+    """Content-addressed cache of extracted file data
+
+    A bounded in-memory LRU tier sits in front of an optional on-disk tier, so
+    re-uploads of the same document skip PDF parsing and the LLM entirely, and
+    survive a restart when a cache directory is configured. Disk entries
+    older than disk_ttl seconds are treated as misses and deleted, and once
+    the directory holds more than disk_max_bytes the least recently used
+    entries are removed until it is back under 80% of the limit (0 disables
+    either bound). Keys should include the extraction settings (see
+    extraction_key), so entries written under other settings are not served.
+    """
+
+    def __init__(self, max_entries=512, disk_dir=None, disk_max_bytes=256 * 1024 * 1024, disk_ttl=7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_ttl = disk_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._cleanup_disk()
+
+    def get(self, digest):
+        """Return a copy of the cached extraction, or None"""
+        with self._lock:
+            data = self._entries.get(digest)
+            if data is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return dict(data)
+
+        data = self._read_disk(digest)
+        if data is None:
+            self.misses += 1
+            return None
+
+        self._remember(digest, data)
+        self.hits += 1
+        return dict(data)
+
+    def set(self, digest, data):
+        """Store an extraction in memory and, if configured, on disk"""
+        self._remember(digest, dict(data))
+        self._write_disk(digest, data)
+
+    def _remember(self, digest, data):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = data
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_path(self, digest):
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.json")
+
+    def _expired(self, mtime):
+        return self.disk_ttl > 0 and time.time() - mtime > self.disk_ttl
+
+    def _read_disk(self, digest):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(digest)
+        try:
+            if self._expired(os.stat(path).st_mtime):
+                self._remove_disk(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # The modification time doubles as the last access for eviction
+            os.utime(path)
+            return data
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, digest, data):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            size = os.path.getsize(tmp_path)
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to write %s: %s", path, e)
+            return
+
+        with self._disk_lock:
+            self._disk_bytes += size
+            over_limit = self.disk_max_bytes > 0 and self._disk_bytes > self.disk_max_bytes
+        if over_limit:
+            self._cleanup_disk()
+
+    def _remove_disk(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        except OSError:
+            return
+        with self._disk_lock:
+            self._disk_bytes -= size
+
+    def _cleanup_disk(self):
+        """Delete expired entries, leftover temp files and, over the size limit, the least recently used entries"""
+        with self._disk_lock:
+            entries = []
+            total = 0
+            for directory, _, names in os.walk(self.disk_dir):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                        if name.endswith(".tmp"):
+                            # Left behind by a writer that died before its rename
+                            if time.time() - stat.st_mtime > 3600:
+                                os.unlink(path)
+                            continue
+                        if not name.endswith(".json"):
+                            continue
+                        if self._expired(stat.st_mtime):
+                            os.unlink(path)
+                            continue
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            removed = 0
+            if self.disk_max_bytes > 0 and total > self.disk_max_bytes:
+                entries.sort()
+                target = self.disk_max_bytes * 0.8
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    removed += 1
+            self._disk_bytes = total
+        if removed:
+            logger.info("Evicted %d extraction cache files from %s", removed, self.disk_dir)
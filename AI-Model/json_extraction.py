@@ -0,0 +1,229 @@
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Removed from keys before they are looked up, so "Chief-Complaint" matches chief_complaint
+_SEPARATORS = str.maketrans("", "", " \t\r\n_-")
+# Complete JSON strings, removed before counting brackets to track depth
+_STRINGS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+# Rank of a primary alias used as a top-level key; nothing beats it
+_BEST_RANK = (0, 1)
+
+
+class JSONSectionExtractor:
+    """Streaming extractor for JSON records and exports such as FHIR-style bundles
+
+    The alias vocabulary is compiled once into an index of normalized keys
+    and one regex that finds any alias used as an object key, at any depth,
+    in snake_case, camelCase, kebab-case or with spaces ("chiefComplaint",
+    "Past Medical History"). extract() reads the document in blocks and only
+    decodes the values of matching keys, so memory stays bounded by the block
+    size and the largest matched value. Each section takes the non-empty
+    value with the best (alias priority, depth) rank: an earlier alias in
+    the section's list wins, then the shallower key, then the first in the
+    file, so a top-level "chief_complaint" beats any "reason". Reading stops
+    once every section has its primary alias at the top level. Keys nested
+    inside a used value are not searched. Unmatched parts of the document
+    are not decoded; a full read still checks that brackets and strings are
+    balanced, and a document with no usable key is parsed in full when no
+    part of it was dropped from the buffer, so malformed input is reported
+    as before.
+    """
+
+    # Characters read from the document at a time
+    BLOCK_CHARS = 256 * 1024
+    # Tail kept between blocks so a key split across them is still found
+    OVERLAP_CHARS = 256
+
+    def __init__(self, section_aliases: dict, max_value_chars=1024 * 1024):
+        self.max_value_chars = max_value_chars
+        self._sections = tuple(section_aliases)
+        # Normalized alias -> (section, priority within the section's aliases)
+        self._alias_to_section = {}
+        for section, aliases in section_aliases.items():
+            for priority, alias in enumerate(aliases):
+                self._alias_to_section.setdefault(self._normalize(alias), (section, priority))
+
+        # Aliases are merged into a prefix tree ("social(?:[\s_\-]?history)?"), which the
+        # regex engine rejects after a character or two at most string positions
+        aliases = [alias for aliases in section_aliases.values() for alias in aliases]
+        self._pattern = re.compile(rf'"(?P<key>{_alternation(_prefix_tree(aliases))})"\s*:\s*', re.IGNORECASE)
+        self._decoder = json.JSONDecoder()
+
+    def extract(self, source) -> dict:
+        """Map section name to the value of its best-ranked matching key
+
+        source is a JSON string or a text file object.
+        """
+        if isinstance(source, str):
+            # Already in memory: search it in place
+            buffer, read, eof = source, None, True
+        else:
+            read, eof = source.read, False
+            buffer = read(self.BLOCK_CHARS)
+        # Whether buffer still starts at the beginning of the document
+        whole = True
+        start = len(buffer) - len(buffer.lstrip())
+        if start == len(buffer):
+            raise ValueError("Invalid JSON format: the document is empty")
+        if buffer[start] != "{":
+            raise ValueError(f"JSON must contain an object/dictionary, got {self._root_type(buffer, start)}")
+
+        # Section -> (rank, text); depth is known up to depth_pos, always outside a string
+        found = {}
+        best = 0
+        pos = depth_pos = start
+        depth = 0
+        while best < len(self._sections):
+            match = self._pattern.search(buffer, pos)
+            if match is None:
+                if eof:
+                    break
+                # Count depth up to any string left open by the block boundary
+                change, safe = self._scan_structure(buffer, depth_pos)
+                depth += change
+                cut = min(safe, max(pos, len(buffer) - self.OVERLAP_CHARS))
+                whole = whole and cut == 0
+                buffer, eof = self._refill(buffer, cut, read)
+                pos, depth_pos = 0, safe - cut
+                continue
+
+            if not self._is_key(buffer, match.start()):
+                pos = match.end()
+                continue
+            if match.start() > depth_pos:
+                depth += self._scan_structure(buffer, depth_pos, match.start())[0]
+                depth_pos = match.start()
+            section, priority = self._alias_to_section[self._normalize(match.group("key"))]
+            rank = (priority, depth)
+            if section in found and found[section][0] <= rank:
+                pos = match.end()
+                continue
+            try:
+                value, end = self._decoder.raw_decode(buffer, match.end())
+            except json.JSONDecodeError as e:
+                if len(buffer) - match.start() > self.max_value_chars:
+                    # Too large to hold; keep searching inside it instead
+                    logger.debug("Skipping %d+ character value of %s", self.max_value_chars, match.group("key"))
+                    pos = match.end()
+                    continue
+                if eof:
+                    raise ValueError(f"Invalid JSON format: {str(e)}")
+                # The value may continue in the next block
+                whole = whole and match.start() == 0
+                buffer, eof = self._refill(buffer, match.start(), read)
+                pos = depth_pos = 0
+                continue
+
+            if end == len(buffer) and not eof:
+                # A number can be cut short at the end of a block
+                whole = whole and match.start() == 0
+                buffer, eof = self._refill(buffer, match.start(), read)
+                pos = depth_pos = 0
+                continue
+
+            text = self._format(value)
+            if text:
+                found[section] = (rank, text)
+                best = sum(1 for entry in found.values() if entry[0] == _BEST_RANK)
+            # The value is balanced, so depth at its end is depth at the key
+            pos = depth_pos = end
+
+        if best < len(self._sections):
+            # Read to the end: the document must at least be balanced
+            change, safe = self._scan_structure(buffer, depth_pos)
+            depth += change
+            if safe < len(buffer) or depth != 0:
+                raise ValueError("Invalid JSON format: the document is incomplete")
+            if not found and whole:
+                self._validate(buffer)
+        return {section: found[section][1] for section in self._sections if section in found}
+
+    @staticmethod
+    def _scan_structure(buffer, start, end=None):
+        """(brackets opened minus closed, end of the scan) for buffer[start:end]
+
+        start must be outside a string. The scan stops at a string that is
+        still open at end, which then has no unescaped quote after its own.
+        """
+        structure = _STRINGS.sub("", buffer[start:end])
+        open_quote = structure.find('"')
+        stop = len(buffer) if end is None else end
+        if open_quote != -1:
+            stop -= len(structure) - open_quote
+            structure = structure[:open_quote]
+        change = (structure.count("{") + structure.count("[")) - (structure.count("}") + structure.count("]"))
+        return change, stop
+
+    def _validate(self, buffer):
+        """Parse a whole in-memory document to report malformed JSON"""
+        try:
+            self._decoder.decode(buffer)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format: {str(e)}")
+
+    @staticmethod
+    def _is_key(buffer, quote):
+        """Whether the string at quote follows "{" or ",", i.e. is an object key
+
+        Outside a string only a key can follow them, and inside one they are
+        always followed by an escaped quote, which the pattern cannot match.
+        """
+        index = quote - 1
+        while index >= 0 and buffer[index] in " \t\r\n":
+            index -= 1
+        return index < 0 or buffer[index] in "{,"
+
+    def _root_type(self, buffer, start):
+        if buffer[start] == "[":
+            return "<class 'list'>"
+        try:
+            return str(type(self._decoder.raw_decode(buffer, start)[0]))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format: {str(e)}")
+
+    def _refill(self, buffer, keep_from, read):
+        """Drop the buffer before keep_from and append the next block"""
+        block = read(self.BLOCK_CHARS)
+        return buffer[keep_from:] + block, not block
+
+    @staticmethod
+    def _format(value):
+        """Section text for a JSON value; empty for null and empty values"""
+        if value is None:
+            return ""
+        # Handle lists (e.g., medications as array)
+        if isinstance(value, list):
+            return ", ".join(str(v) for v in value)
+        if isinstance(value, dict):
+            return json.dumps(value, indent=2) if value else ""
+        return str(value).strip()
+
+    @staticmethod
+    def _normalize(key):
+        return key.translate(_SEPARATORS).lower()
+
+
+def _prefix_tree(words):
+    tree = {}
+    for word in words:
+        node = tree
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return tree
+
+
+def _alternation(node):
+    """Regex for the words in a prefix tree, with "_" matching any separator or none"""
+    branches = [
+        (r"[\s_\-]?" if char == "_" else re.escape(char)) + _alternation(child)
+        for char, child in sorted(node.items()) if char
+    ]
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")" + ("?" if "" in node else "")
@@ -0,0 +1,271 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent import futures
+from llm_scheduler import LLMQueueFull
+from metrics import LLM_RETRIES, LLM_HEDGES, LLM_DEADLINES_EXCEEDED
+
+# Seconds each call site may take in total, including retries, hedges and queueing
+DEFAULT_DEADLINES = {
+    "generate_summary": 30,
+    "extract_from_pdf": 60,
+    "stream_summary": 60
+}
+
+# Seconds a streaming call site may wait for its first chunk
+DEFAULT_FIRST_TOKEN_DEADLINES = {
+    "stream_summary": 15
+}
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """An LLM call site ran out of time before any attempt succeeded"""
+
+
+class RetryBudget:
+    """Token bucket that caps retries and hedges to a fraction of normal calls
+
+    Every first attempt deposits ratio tokens and every extra attempt spends
+    one, so during an outage retries add at most ratio x the normal load
+    instead of multiplying it.
+    """
+
+    def __init__(self, ratio=0.1, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """Spend one token for an extra attempt; False when the budget is exhausted"""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class LatencyTracker:
+    """Recent successful attempt latencies per call site, for the hedge delay"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, call_site, seconds):
+        with self._lock:
+            samples = self._samples.get(call_site)
+            if samples is None:
+                samples = self._samples[call_site] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, call_site, q, min_samples=20):
+        """Latency at quantile q, or None until min_samples calls have finished"""
+        with self._lock:
+            samples = sorted(self._samples.get(call_site, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class LLMCallPolicy:
+    """Deadlines, budgeted retries with jitter and optional hedging for LLM calls
+
+    call()/acall() run attempt_fn until one attempt succeeds, the call site's
+    deadline passes (LLMDeadlineExceeded) or retries run out (the last error
+    is raised). Failed attempts are retried after a full-jitter backoff while
+    the shared RetryBudget allows. With hedge enabled, a second attempt starts
+    when the first is slower than the call site's recent p95, and the first
+    answer wins. LLMQueueFull is never retried. astream() only applies the
+    deadlines, since chunks already relayed cannot be taken back.
+    """
+
+    def __init__(self, deadlines=None, first_token_deadlines=None, max_retries=2, retry_budget=None, hedge=False,
+                 hedge_quantile=0.95, hedge_min_delay=0.1, backoff_base=0.2, backoff_max=2.0):
+        self.deadlines = dict(DEFAULT_DEADLINES if deadlines is None else deadlines)
+        self.first_token_deadlines = dict(
+            DEFAULT_FIRST_TOKEN_DEADLINES if first_token_deadlines is None else first_token_deadlines
+        )
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget()
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latencies = LatencyTracker()
+        # Blocking attempts run in a thread pool so the caller can stop waiting at the deadline
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _hedge_delay(self, call_site):
+        if not self.hedge:
+            return None
+        p95 = self.latencies.quantile(call_site, self.hedge_quantile)
+        return None if p95 is None else max(self.hedge_min_delay, p95)
+
+    def _backoff(self, retry):
+        # Full jitter: uniform between 0 and the capped exponential delay
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    def _should_retry(self, error, retries, call_site):
+        if isinstance(error, LLMQueueFull) or retries >= self.max_retries:
+            return False
+        if not self.retry_budget.withdraw():
+            return False
+        LLM_RETRIES.inc(call_site=call_site)
+        return True
+
+    def _timed(self, call_site, attempt_fn):
+        start = time.perf_counter()
+        result = attempt_fn()
+        self.latencies.record(call_site, time.perf_counter() - start)
+        return result
+
+    async def _atimed(self, call_site, attempt_fn):
+        start = time.perf_counter()
+        result = await attempt_fn()
+        self.latencies.record(call_site, time.perf_counter() - start)
+        return result
+
+    def call(self, call_site, attempt_fn):
+        """Run the blocking attempt_fn() under the call site's policy"""
+        self.retry_budget.deposit()
+        deadline = self.deadlines.get(call_site)
+        end = time.monotonic() + deadline if deadline else None
+        hedge_delay = self._hedge_delay(call_site)
+        pending = {self._get_executor().submit(self._timed, call_site, attempt_fn)}
+        retries = 0
+        last_error = None
+
+        while pending:
+            remaining = None if end is None else end - time.monotonic()
+            wait = hedge_delay if remaining is None else min(remaining, hedge_delay or remaining)
+            done, pending = futures.wait(pending, timeout=wait, return_when=futures.FIRST_COMPLETED)
+
+            if done:
+                succeeded = [f for f in done if f.exception() is None]
+                if succeeded:
+                    for other in pending:
+                        other.cancel()
+                    return succeeded[0].result()
+                last_error = next(iter(done)).exception()
+                if pending or not self._should_retry(last_error, retries, call_site):
+                    continue
+                retries += 1
+                pause = self._backoff(retries)
+                if end is not None and time.monotonic() + pause >= end:
+                    break
+                time.sleep(pause)
+                pending.add(self._get_executor().submit(self._timed, call_site, attempt_fn))
+            elif end is not None and time.monotonic() >= end:
+                break
+            else:
+                # Hedge timer fired: start one extra attempt if the budget allows
+                hedge_delay = None
+                if self.retry_budget.withdraw():
+                    LLM_HEDGES.inc(call_site=call_site)
+                    pending.add(self._get_executor().submit(self._timed, call_site, attempt_fn))
+
+        if pending or last_error is None:
+            for other in pending:
+                other.cancel()
+            LLM_DEADLINES_EXCEEDED.inc(call_site=call_site)
+            raise LLMDeadlineExceeded(f"LLM call '{call_site}' exceeded its {deadline}s deadline")
+        raise last_error
+
+    async def acall(self, call_site, attempt_fn):
+        """Async variant of call; attempt_fn() returns a coroutine and losers are cancelled"""
+        self.retry_budget.deposit()
+        deadline = self.deadlines.get(call_site)
+        end = time.monotonic() + deadline if deadline else None
+        hedge_delay = self._hedge_delay(call_site)
+        pending = {asyncio.ensure_future(self._atimed(call_site, attempt_fn))}
+        retries = 0
+        last_error = None
+
+        try:
+            while pending:
+                remaining = None if end is None else end - time.monotonic()
+                wait = hedge_delay if remaining is None else min(remaining, hedge_delay or remaining)
+                done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+                if done:
+                    succeeded = [t for t in done if t.exception() is None]
+                    if succeeded:
+                        return succeeded[0].result()
+                    last_error = next(iter(done)).exception()
+                    if pending or not self._should_retry(last_error, retries, call_site):
+                        continue
+                    retries += 1
+                    pause = self._backoff(retries)
+                    if end is not None and time.monotonic() + pause >= end:
+                        break
+                    await asyncio.sleep(pause)
+                    pending.add(asyncio.ensure_future(self._atimed(call_site, attempt_fn)))
+                elif end is not None and time.monotonic() >= end:
+                    break
+                else:
+                    hedge_delay = None
+                    if self.retry_budget.withdraw():
+                        LLM_HEDGES.inc(call_site=call_site)
+                        pending.add(asyncio.ensure_future(self._atimed(call_site, attempt_fn)))
+        finally:
+            for other in pending:
+                other.cancel()
+
+        if pending or last_error is None:
+            LLM_DEADLINES_EXCEEDED.inc(call_site=call_site)
+            raise LLMDeadlineExceeded(f"LLM call '{call_site}' exceeded its {deadline}s deadline")
+        raise last_error
+
+    async def astream(self, call_site, chunks):
+        """Relay the async iterable chunks under the call site's deadlines
+
+        The first chunk must arrive within the first-token deadline and the
+        stream must end within the total deadline; otherwise the stream is
+        closed and LLMDeadlineExceeded is raised.
+        """
+        deadline = self.deadlines.get(call_site)
+        first_token_deadline = self.first_token_deadlines.get(call_site)
+        start = time.monotonic()
+        iterator = chunks.__aiter__()
+        waiting_for_first = True
+        try:
+            while True:
+                limits = [limit for limit in (deadline, first_token_deadline if waiting_for_first else None) if limit]
+                timeout = max(0, start + min(limits) - time.monotonic()) if limits else None
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    LLM_DEADLINES_EXCEEDED.inc(call_site=call_site)
+                    stage = "first-token" if waiting_for_first else "total"
+                    raise LLMDeadlineExceeded(
+                        f"LLM call '{call_site}' exceeded its {min(limits)}s {stage} deadline"
+                    ) from None
+                waiting_for_first = False
+                yield chunk
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+            return self._executor
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
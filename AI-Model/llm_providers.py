@@ -0,0 +1,261 @@
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+LLM_PROVIDERS = ("gemini", "synthetic", "replay")
+
+# Model used for each task: mechanical JSON extraction runs on a flash-class model,
+# summaries and conversation on the stronger model, which also handles escalations
+DEFAULT_MODELS = {
+    "extraction": "gemini-2.5-flash",
+    "summary": "gemini-2.5-pro",
+    "conversation": "gemini-2.5-pro"
+}
+DEFAULT_ESCALATION_MODEL = "gemini-2.5-pro"
+
+# Marker and key pattern of the PDF extraction prompt, answered with JSON
+JSON_PROMPT_MARKER = "Return ONLY valid JSON"
+JSON_KEY_PATTERN = re.compile(r'^\s*"(\w+)":', re.MULTILINE)
+# "Generated:" timestamp of the summary prompt, masked so a replay matches a recording
+GENERATED_PATTERN = re.compile(r"^Generated: \d{4}-\d{2}-\d{2} \d{2}:\d{2}$", re.MULTILINE)
+
+
+def gemini_llm(api_key, model=DEFAULT_ESCALATION_MODEL):
+    """The production chat model"""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model = model,
+        api_key = api_key,
+        temperature = 0.4,
+        max_output_tokens = 2048,
+        # Retries happen in LLMCallPolicy under a shared budget and deadline
+        max_retries = 0
+    )
+
+
+def prompt_hash(prompt):
+    """SHA-256 of a prompt string or a list of chat messages
+
+    The summary prompt's generation time is replaced by a fixed token first,
+    so the same prompt hashes the same in any minute.
+    """
+    if isinstance(prompt, str):
+        payload = _mask_generated(prompt)
+    else:
+        payload = json.dumps([[message.type, _mask_generated(message.content)] for message in prompt])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _mask_generated(text):
+    return GENERATED_PATTERN.sub("Generated: <timestamp>", text) if isinstance(text, str) else text
+
+
+def model_name(llm):
+    """Model label of a chat model, used to break metrics down by model"""
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+def create_llm(provider="gemini", api_key=None, model=DEFAULT_ESCALATION_MODEL, record_path=None, replay_path=None,
+               replay_latency=True, **synthetic_options):
+    """Build the chat model for a provider name
+
+    "gemini" calls the real API with the given model (optionally recording
+    every answer to record_path), "replay" serves answers recorded earlier
+    and "synthetic" generates placeholder answers with simulated latency.
+    Neither local provider needs an API key or network access; they only
+    use model as the label reported in metrics.
+    """
+    if provider == "gemini":
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY environment variable not set")
+        llm = gemini_llm(api_key, model)
+        return RecordingLLM(llm, record_path) if record_path else llm
+    if provider == "replay":
+        if not replay_path:
+            raise ValueError("LLM_REPLAY_PATH must be set for the replay provider")
+        return ReplayLLM(replay_path, replay_latency, model)
+    if provider == "synthetic":
+        return SyntheticLLM(model=model, **synthetic_options)
+    raise ValueError(f"Unknown LLM provider '{provider}', expected one of {', '.join(LLM_PROVIDERS)}")
+
+
+class RecordingLLM:
+    """Wraps a chat model and appends each prompt hash and answer to a JSONL file
+
+    The file is the input of ReplayLLM. Latency is recorded too, so a replay
+    can reproduce the timing of the original run.
+    """
+
+    # Shared by every recorder, since the task models may all append to one file
+    _lock = threading.Lock()
+
+    def __init__(self, llm, path):
+        self.llm = llm
+        self.path = path
+        self.model_name = model_name(llm)
+
+    def invoke(self, prompt, **kwargs):
+        start = time.perf_counter()
+        response = self.llm.invoke(prompt, **kwargs)
+        self._record(prompt, response.content, start)
+        return response
+
+    async def ainvoke(self, prompt, **kwargs):
+        start = time.perf_counter()
+        response = await self.llm.ainvoke(prompt, **kwargs)
+        self._record(prompt, response.content, start)
+        return response
+
+    async def astream(self, prompt, **kwargs):
+        start = time.perf_counter()
+        chunks = []
+        async for chunk in self.llm.astream(prompt, **kwargs):
+            chunks.append(chunk.content)
+            yield chunk
+        self._record(prompt, "".join(chunks), start)
+
+    def _record(self, prompt, content, start):
+        line = json.dumps({
+            "prompt_hash": prompt_hash(prompt),
+            "content": content,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1)
+        })
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class ReplayLLM:
+    """Serves answers recorded by RecordingLLM, keyed by prompt hash
+
+    A prompt that was never recorded raises KeyError, which the chatbot
+    handles like any other LLM failure. With replay_latency the recorded
+    latency is slept before answering.
+    """
+
+    def __init__(self, path, replay_latency=True, model="replay"):
+        self.model_name = model
+        self.replay_latency = replay_latency
+        self._responses = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._responses[entry["prompt_hash"]] = entry
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, prompt):
+        entry = self._responses.get(prompt_hash(prompt))
+        if entry is None:
+            self.misses += 1
+            raise KeyError("No recorded response for this prompt")
+        self.hits += 1
+        return entry
+
+    def _delay(self, entry):
+        return entry.get("latency_ms", 0) / 1000 if self.replay_latency else 0
+
+    def invoke(self, prompt, **kwargs):
+        entry = self._lookup(prompt)
+        time.sleep(self._delay(entry))
+        return AIMessage(content=entry["content"])
+
+    async def ainvoke(self, prompt, **kwargs):
+        entry = self._lookup(prompt)
+        await asyncio.sleep(self._delay(entry))
+        return AIMessage(content=entry["content"])
+
+    async def astream(self, prompt, **kwargs):
+        entry = self._lookup(prompt)
+        await asyncio.sleep(self._delay(entry))
+        yield AIMessageChunk(content=entry["content"])
+
+
+class SyntheticLLM:
+    """Local stand-in that answers with placeholder text after a simulated delay
+
+    Each call waits a time-to-first-token drawn from latency_distribution
+    ("fixed", "uniform", "exponential" or "lognormal", all with mean
+    latency_ms), then emits output_tokens tokens at tokens_per_second.
+    Extraction prompts get a JSON object with every requested key set to
+    null. A fraction error_rate of calls raise RuntimeError. model only
+    labels the metrics, so fast and strong tiers can be simulated with two
+    instances of different latency.
+    """
+
+    DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+    def __init__(self, latency_ms=800, latency_distribution="lognormal", latency_sigma=0.5,
+                 tokens_per_second=50, output_tokens=200, error_rate=0.0, seed=None, model="synthetic"):
+        if latency_distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{latency_distribution}'")
+        self.model_name = model
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _first_token_delay(self):
+        mean = self.latency_ms / 1000
+        with self._lock:
+            if self.latency_distribution == "fixed":
+                return mean
+            if self.latency_distribution == "uniform":
+                return self._random.uniform(0, 2 * mean)
+            if self.latency_distribution == "exponential":
+                return self._random.expovariate(1 / mean) if mean > 0 else 0
+            # Lognormal with the configured mean: mu = ln(mean) - sigma^2 / 2
+            if mean <= 0:
+                return 0
+            mu = math.log(mean) - self.latency_sigma ** 2 / 2
+            return self._random.lognormvariate(mu, self.latency_sigma)
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _tokens(self, prompt):
+        text = prompt if isinstance(prompt, str) else prompt[-1].content
+        if JSON_PROMPT_MARKER in text:
+            keys = JSON_KEY_PATTERN.findall(text.split("exact keys", 1)[-1])
+            return [json.dumps({key: None for key in keys})]
+        return ["Synthetic"] + [" response"] * max(0, self.output_tokens - 1)
+
+    def _token_interval(self):
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+    def invoke(self, prompt, **kwargs):
+        tokens = self._tokens(prompt)
+        time.sleep(self._first_token_delay() + len(tokens) * self._token_interval())
+        if self._should_fail():
+            raise RuntimeError("Synthetic LLM error")
+        return AIMessage(content="".join(tokens))
+
+    async def ainvoke(self, prompt, **kwargs):
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self._first_token_delay() + len(tokens) * self._token_interval())
+        if self._should_fail():
+            raise RuntimeError("Synthetic LLM error")
+        return AIMessage(content="".join(tokens))
+
+    async def astream(self, prompt, **kwargs):
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self._first_token_delay())
+        if self._should_fail():
+            raise RuntimeError("Synthetic LLM error")
+        interval = self._token_interval()
+        for token in tokens:
+            await asyncio.sleep(interval)
+            yield AIMessageChunk(content=token)
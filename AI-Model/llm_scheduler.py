@@ -0,0 +1,201 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+from metrics import LLM_QUEUE_WAIT_SECONDS, LLM_QUEUE_REJECTED
+
+# Priority classes, lowest value served first
+INTERACTIVE = 0
+EXTRACTION = 1
+BATCH = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", EXTRACTION: "extraction", BATCH: "batch"}
+
+# Overrides the call site's default priority for everything run in this context
+current_priority = contextvars.ContextVar("llm_priority", default=None)
+
+
+class SharedPriority:
+    """Priority of one call made on behalf of several callers
+
+    Used as the priority of a shared call (see SingleFlight.ado): level is
+    the most urgent priority among the callers so far, and join() moves a
+    slot request already queued at a lower priority up, so an interactive
+    caller is not held back by the batch job that started the call.
+    """
+
+    __slots__ = ("level", "_listeners")
+
+    def __init__(self, level):
+        self.level = level
+        self._listeners = []
+
+    def join(self, priority):
+        level = priority_level(priority)
+        if level < self.level:
+            self.level = level
+            for listener in self._listeners:
+                listener(level)
+
+    def listen(self, listener):
+        """Call listener(level) whenever a more urgent caller joins"""
+        self._listeners.append(listener)
+
+
+def priority_level(priority):
+    """Priority class of a priority or SharedPriority"""
+    return priority.level if isinstance(priority, SharedPriority) else priority
+
+
+class LLMQueueFull(Exception):
+    """Too many LLM calls are already waiting; retry after retry_after seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__("The AI service is busy right now. Please try again shortly.")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, priority, loop=None):
+        self.priority = priority
+        self.event = threading.Event() if loop is None else None
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """Global concurrency cap for LLM calls with strict priority classes
+
+    At most max_concurrency calls run at once. When all slots are busy,
+    callers queue and a freed slot goes to the highest-priority (then
+    oldest) waiter, so interactive summaries overtake file extraction,
+    which overtakes batch work. Interactive and extraction callers are
+    rejected with LLMQueueFull once max_queue of them are waiting; batch
+    callers always queue because the batch workers already bound them.
+    Threads and coroutines share the same slots. A SharedPriority may be
+    passed instead of a priority class; its queued request follows it up.
+    """
+
+    def __init__(self, max_concurrency=8, max_queue=64):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = []
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._sequence = itertools.count()
+        # Moving average of how long a call holds its slot, for Retry-After
+        self._average_hold = 1.0
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def queued(self):
+        return sum(self._queued.values())
+
+    @contextmanager
+    def slot(self, priority):
+        """Hold one LLM slot for the with block (blocking the thread while queued)"""
+        start = time.perf_counter()
+        waiter = self._enqueue(priority, None)
+        if waiter is not None:
+            waiter.event.wait()
+        LLM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, priority=PRIORITY_NAMES[priority_level(priority)])
+        held = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - held)
+
+    @asynccontextmanager
+    async def aslot(self, priority):
+        """Async variant of slot that waits without blocking the event loop"""
+        start = time.perf_counter()
+        waiter = self._enqueue(priority, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        LLM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, priority=PRIORITY_NAMES[priority_level(priority)])
+        held = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - held)
+
+    def _enqueue(self, priority, loop):
+        """Take a free slot (returns None) or queue a waiter for one"""
+        level = priority_level(priority)
+        with self._lock:
+            if self._active < self.max_concurrency:
+                self._active += 1
+                return None
+            queued = self._queued[INTERACTIVE] + self._queued[EXTRACTION]
+            if level != BATCH and queued >= self.max_queue:
+                retry_after = math.ceil(self._average_hold * (queued + 1) / self.max_concurrency)
+                LLM_QUEUE_REJECTED.inc(priority=PRIORITY_NAMES[level])
+                raise LLMQueueFull(max(1, retry_after))
+            waiter = _Waiter(level, loop)
+            heapq.heappush(self._waiting, (level, next(self._sequence), waiter))
+            self._queued[level] += 1
+        if isinstance(priority, SharedPriority):
+            priority.listen(lambda level: self._promote(waiter, level))
+        return waiter
+
+    def _promote(self, waiter, level):
+        """Requeue a waiter at a more urgent priority; its old heap entry is skipped"""
+        with self._lock:
+            if waiter.granted or waiter.cancelled or level >= waiter.priority:
+                return
+            self._queued[waiter.priority] -= 1
+            self._queued[level] += 1
+            waiter.priority = level
+            heapq.heappush(self._waiting, (level, next(self._sequence), waiter))
+
+    def _abandon(self, waiter):
+        """A queued coroutine was cancelled; give back its slot if it already had one"""
+        with self._lock:
+            granted = waiter.granted
+            if not granted:
+                waiter.cancelled = True
+                self._queued[waiter.priority] -= 1
+        if granted:
+            self._release(None)
+
+    def _release(self, held_seconds):
+        with self._lock:
+            if held_seconds is not None:
+                self._average_hold = 0.9 * self._average_hold + 0.1 * held_seconds
+            while self._waiting:
+                _, _, waiter = heapq.heappop(self._waiting)
+                if waiter.cancelled or waiter.granted:
+                    # Abandoned, or a stale entry of a promoted waiter
+                    continue
+                # Hand the slot straight to the next waiter; the active count is unchanged
+                waiter.granted = True
+                self._queued[waiter.priority] -= 1
+                break
+            else:
+                self._active -= 1
+                return
+
+        if waiter.loop is None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,203 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds in seconds; covers fast in-process stages up to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    type_name = "counter"
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Gauge:
+    """Current value, either set directly or read from a callback at scrape time"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, description, function=None):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._function = function
+
+    def set(self, value):
+        self._value = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self):
+        value = self._function() if self._function else self._value
+        return [(self.name, "", value)]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label combination"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One count per bucket plus +Inf, then the running sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block, including when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+
+        samples = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum", labels, series[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text exposition format
+
+    Metrics are plain counters updated under a lock, so recording costs a
+    dictionary update and a scrape only formats what is already in memory.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "path", "status")
+))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time to produce the response headers, by route", ("method", "path")
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "stage_duration_seconds", "Duration of processing stages (pdf_text, json_extraction, pdf_extraction)", ("stage",)
+))
+LLM_CALL_SECONDS = REGISTRY.register(Histogram(
+    "llm_call_duration_seconds", "LLM call duration by call site and model", ("call_site", "model")
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "LLM tokens by model and direction (input, output), estimated when not reported",
+    ("model", "direction")
+))
+LLM_ESCALATIONS = REGISTRY.register(Counter(
+    "llm_escalations_total", "Calls repeated on the escalation model after the task model's answer failed validation",
+    ("call_site",)
+))
+LLM_ERRORS = REGISTRY.register(Counter(
+    "llm_errors_total", "Failed LLM calls by call site", ("call_site",)
+))
+SUMMARY_FALLBACKS = REGISTRY.register(Counter(
+    "summary_fallbacks_total", "Summaries served from the template because the LLM failed"
+))
+LLM_RETRIES = REGISTRY.register(Counter(
+    "llm_retries_total", "LLM attempts retried after an error by call site", ("call_site",)
+))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "llm_hedges_total", "Hedged second attempts started by call site", ("call_site",)
+))
+LLM_DEADLINES_EXCEEDED = REGISTRY.register(Counter(
+    "llm_deadlines_exceeded_total", "LLM calls abandoned at their deadline by call site", ("call_site",)
+))
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "llm_queue_wait_seconds", "Time spent waiting for an LLM slot by priority class", ("priority",)
+))
+LLM_QUEUE_REJECTED = REGISTRY.register(Counter(
+    "llm_queue_rejected_total", "LLM calls rejected because the queue was full", ("priority",)
+))
+LLM_SCHEDULER_ACTIVE = REGISTRY.register(Gauge(
+    "llm_scheduler_active", "LLM calls currently holding a slot"
+))
+LLM_SCHEDULER_QUEUED = REGISTRY.register(Gauge(
+    "llm_scheduler_queued", "LLM calls waiting for a slot"
+))
+SINGLEFLIGHT_SHARED = REGISTRY.register(Counter(
+    "singleflight_shared_total", "Calls answered by an identical call already in flight", ("flight",)
+))
+SESSION_STORE_SIZE = REGISTRY.register(Gauge(
+    "session_store_sessions", "Sessions currently held by the session store"
+))
@@ -0,0 +1,193 @@
+import signal
+import asyncio
+import threading
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from PyPDF2 import PdfReader
+from uploads import SpooledUpload
+
+
+def read_pdf_text(pdf_content, max_pages: int = 0) -> str:
+    """Extract raw text from every page of a PDF (runs inside a worker process)
+
+    pdf_content is bytes or a SpooledUpload; a spooled upload's temp file is
+    memory-mapped and read in place rather than copied into the process.
+    """
+    # Ensure pdf_content is bytes
+    if isinstance(pdf_content, str):
+        raise ValueError("PDF content must be bytes, not string")
+
+    if isinstance(pdf_content, SpooledUpload):
+        with pdf_content.buffer() as buffer:
+            return _read_pdf_stream(buffer if pdf_content.path else BytesIO(buffer), max_pages)
+    return _read_pdf_stream(BytesIO(pdf_content), max_pages)
+
+
+class _Deadline(BaseException):
+    """Raised by the alarm in a worker; a BaseException so PDF parsing code cannot swallow it"""
+
+
+def read_pdf_text_with_deadline(pdf_content, max_pages: int = 0, timeout: float = 0) -> str:
+    """read_pdf_text interrupted after timeout seconds by SIGALRM
+
+    Runs the timeout inside the process doing the work, so a stuck document
+    fails on its own while the worker process lives on for the next job. The
+    alarm needs the main thread of a process with SIGALRM, as in a pool
+    worker; elsewhere the text is read without a timeout.
+    """
+    if not timeout or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        return read_pdf_text(pdf_content, max_pages)
+
+    def expire(signum, frame):
+        raise _Deadline()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return read_pdf_text(pdf_content, max_pages)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _Deadline:
+        raise TimeoutError(f"PDF text extraction timed out after {timeout} seconds") from None
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _read_pdf_stream(stream, max_pages):
+    reader = PdfReader(stream)
+
+    # Page count is cheap to read, so reject long documents before extracting
+    page_count = len(reader.pages)
+    if max_pages and page_count > max_pages:
+        raise ValueError(f"PDF has {page_count} pages, the limit is {max_pages}")
+
+    # Extract all text from PDF
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text() + "\n"
+    return text
+
+
+# Rough token estimate used to size LLM prompts without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def chunk_text(text: str, max_tokens: int = 750) -> list:
+    """Split text into chunks of at most max_tokens, breaking on line boundaries"""
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    chunks = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        # Hard-split lines that cannot fit in a chunk on their own
+        while len(line) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+class PDFExtractor:
+    """Runs CPU-bound PDF text extraction in a process pool with time and size budgets
+
+    A job over the timeout is interrupted inside its worker, so only that
+    document fails. The pool is only replaced when a job is still running
+    kill_grace seconds after its timeout, i.e. it is stuck where the alarm
+    cannot interrupt it.
+    """
+
+    # Seconds past the timeout before a job that ignored its alarm is killed with the pool
+    kill_grace = 5
+
+    def __init__(self, max_workers=2, timeout=30, max_pages=200, max_bytes=20 * 1024 * 1024):
+        # max_workers=0 extracts inline on the calling thread
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def extract_text(self, pdf_content: bytes) -> str:
+        """Extract PDF text, blocking until the worker finishes or times out"""
+        self.check_size(pdf_content)
+        if not self.max_workers:
+            try:
+                # Only interrupted when called on the main thread
+                return read_pdf_text_with_deadline(pdf_content, self.max_pages, self.timeout)
+            except TimeoutError:
+                raise ValueError(f"PDF text extraction timed out after {self.timeout} seconds")
+
+        future = self._get_pool().submit(read_pdf_text_with_deadline, pdf_content, self.max_pages, self.timeout)
+        try:
+            return future.result(timeout=self._backstop())
+        except (FutureTimeoutError, TimeoutError):
+            # Done means the worker's own alarm fired and the worker is fine
+            if not future.done():
+                self._recycle_pool()
+            raise ValueError(f"PDF text extraction timed out after {self.timeout} seconds")
+
+    async def aextract_text(self, pdf_content: bytes) -> str:
+        """Extract PDF text without blocking the event loop"""
+        self.check_size(pdf_content)
+        if not self.max_workers:
+            # A thread cannot be stopped: the request gives up on time and the
+            # thread finishes the document in the background
+            try:
+                return await asyncio.wait_for(
+                    asyncio.to_thread(read_pdf_text, pdf_content, self.max_pages), timeout=self.timeout or None
+                )
+            except asyncio.TimeoutError:
+                raise ValueError(f"PDF text extraction timed out after {self.timeout} seconds")
+
+        future = self._get_pool().submit(read_pdf_text_with_deadline, pdf_content, self.max_pages, self.timeout)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self._backstop())
+        except (asyncio.TimeoutError, TimeoutError):
+            if not future.done():
+                self._recycle_pool()
+            raise ValueError(f"PDF text extraction timed out after {self.timeout} seconds")
+
+    def check_size(self, pdf_content):
+        """Reject documents over the byte budget before they reach a worker"""
+        if self.max_bytes and len(pdf_content) > self.max_bytes:
+            raise ValueError(
+                f"PDF is {len(pdf_content) // 1024} KB, the limit is {self.max_bytes // 1024} KB"
+            )
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _backstop(self):
+        """Seconds to wait for a worker before giving up on its alarm"""
+        return self.timeout + self.kill_grace if self.timeout else None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def _recycle_pool(self):
+        # Last resort for a job that ignored its alarm: a running job cannot be cancelled,
+        # so terminate the workers and start fresh. Other jobs still running on the old
+        # pool fail and surface as extraction errors.
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
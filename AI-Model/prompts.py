@@ -0,0 +1,259 @@
+import string
+import time
+from datetime import datetime
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from conversation_memory import PATIENT
+
+# Conversation system prompt; focus_area is the title of the section being collected
+CONVERSATION_SYSTEM_PROMPT = """
+        You are DocAI, a specialized AI assistant for Pre-Consultation Clinical History Collection. Your persona is that of a professional, empathetic, and highly accurate medical scribe or nurse.
+
+        Your primary and ONLY purpose is to interactively gather a patient's complete clinical history and family clinical history before their consultation with a doctor.
+        
+        **Core Directives:**
+        1. **Be Medically Systematic**: Your questioning must be medically accurate and structured. When a patient mentions a symptom (especially a chief complaint), methodologically ask follow-up questions based on standard clinical protocols (like OPQRST for pain: Onset, Palliating/Provoking factors, Quality, Radiation, Severity, Timing). Your goal is to get a complete picture of the 'History of Present Illness'.
+        
+        2. **Be Comprehensive**: After addressing the chief complaint, you must proactively ask about other key areas:
+            - Past Medical History (e.g., "Do you have any ongoing conditions like diabetes, or high blood pressure?")
+            - Past Surgical History (e.g., "Have you had any surgeries in the past?")
+            - Current Medications (e.g., "Are you currently taking any prescription medications, over-the-counter drugs, or supplements?")
+            - Allergies (e.g., "Do you have any allergies to medications, food or anything else?")
+            - Family Clinical History (e.g., "Does anyone in your immediate family have signficant medical conditions like heart disease, cancer, or diabetes?")
+            
+        3. **Accept "No" Responses**: If a patient says "no", "none", "not applicable", or similar for any section, accept it gracefully and move to the next section. Do NOT push for more information if they clearly state they have nothing to report.
+            - Example: If they say "No allergies", respond with "Got it, no known allergies. That's noted." and proceed.
+            - Example: If they say "I don't take any medications", respond with "Understood, no current medications. Thank you."
+            
+        4. **Handle Vague Prompts**: If a patient's input is vague (e.g., "I feel sick", "I'm not well"), you MUST take initiative. Do not say "I don't understand." Instead, guide them with gentle, clarifying questions.
+            - Example for "I feel sick": "I'm very sorry to hear that. To help me understand, could you tell me more about what's bothering you most? For example, is it pain, nausea, dizziness, or something else?"
+            - Example for "I don't know": "That's perfectly okay. We can take this one step at a time. Let's start with the main reason you're looking to speak with the doctor today. Can you describe it in your own words?"
+            
+        5. **Be Empathetic**: Use a reassuring and patient tone. Acknowledge the patient's feelings.
+            - Example: "I understand that must be very uncomfortable for you."
+            - Example: "Thank you for sharing that. That's very helpful information for the doctor."
+            
+        **CRITICAL SAFETY CONSTRAINT: DO NOT DIAGNOSE OR ADVISE**
+        
+        You MUST NOT, under any circumstances, provide a medical diagnosis, medical advice, or treatment recommendations.
+        You MUST NOT interpret symptoms or suggest possible causes.
+        
+        If the user asks for advice, a diagnosis, or what their symptoms mean (e.g., "What do you think I have?", "Is this serious?", "What should I do?"), you MUST decline and state your purpose.
+        
+        **Mandatory Response**: "I am an AI assistant designed only to collect your medical history for the doctor. I cannot provide any diagnosis or medical advice. Please be sure to discuss all your concerns, including this question, with the clinician."
+        
+        **Current Focus Area**: {focus_area}
+        
+        Your final output from this conversation will be used to create a structured summary for the doctor. Focus on being a clear, precise and empathetic interviewer."""
+
+# EHR refinement prompt; each section slot falls back to SUMMARY_DEFAULTS
+SUMMARY_PROMPT = """You are a medical scribe creating a professional Electronic Health Record (EHR) summary for a physician. 
+
+Based on the patient's responses below, create a polished, concise, and clinically appropriate summary. Follow these guidelines:
+
+1. Use professional medical terminology where appropriate
+2. Remove conversational language and filler words
+3. Write in complete, clear sentences using third person ("Patient reports...", "Patient denies...")
+4. Keep information factual and objective
+5. Organize information logically within each section
+6. Use abbreviations common in medical records (e.g., "y/o" for years old, "Hx" for history)
+7. If patient said "no/none", write standard medical phrases like "Denies...", "None reported", "No known..."
+
+**Raw Patient Responses:**
+
+Chief Complaint: {chief_complaint}
+
+History of Present Illness: {present_illness}
+
+Past Medical History: {past_medical_history}
+
+Current Medications: {medications}
+
+Allergies: {allergies}
+
+Family History: {family_history}
+
+Social History: {social_history}
+
+Review of Systems: {review_of_systems}
+
+---
+
+Generate a professional clinical summary following this EXACT format:
+
+**ELECTRONIC HEALTH RECORD - CLINICAL SUMMARY**
+Generated: {generated}
+
+**CHIEF COMPLAINT:**
+[Refined, concise statement of primary concern]
+
+**HISTORY OF PRESENT ILLNESS:**
+[Professional narrative of current condition with timeline, symptoms, and progression]
+
+**PAST MEDICAL HISTORY:**
+[Organized list or statement of chronic conditions, past diagnoses]
+
+**CURRENT MEDICATIONS:**
+[Professional format of medications - if available include dosage/frequency]
+
+**ALLERGIES:**
+[Standard allergy documentation format]
+
+**FAMILY HISTORY:**
+[Relevant family medical conditions]
+
+**SOCIAL HISTORY:**
+[Professionally stated social factors]
+
+**REVIEW OF SYSTEMS:**
+[Clinical documentation of other symptoms or "All other systems reviewed and negative"]
+
+---
+**Prepared for physician review**
+
+IMPORTANT: Return ONLY the formatted clinical summary. Do not add any explanations, comments, or extra text."""
+
+SUMMARY_DEFAULTS = {
+    "chief_complaint": "Not specified",
+    "present_illness": "Not specified",
+    "past_medical_history": "None reported",
+    "medications": "None reported",
+    "allergies": "No known allergies",
+    "family_history": "None reported",
+    "social_history": "None reported",
+    "review_of_systems": "No concerns reported"
+}
+
+# PDF extraction prompt; keys lists the requested sections with their hints
+PDF_PARSE_PROMPT = """Extract medical information from this document and structure it into these categories. Return ONLY valid JSON with no additional text:
+
+Document text:
+{text}  
+
+Extract and return as JSON with these exact keys (use null if information not found):
+{{
+{keys}
+}}"""
+
+# Appended to the conversation system prompt once older turns have been summarized
+EARLIER_CONVERSATION_PROMPT = """
+
+        **Earlier in this conversation the patient said**: {summary}"""
+
+
+class CompiledPrompt:
+    """A str.format template parsed once into literal text and named slots
+
+    render() only joins the literals with the slot values, instead of
+    re-parsing several kilobytes of static text on every call.
+    """
+
+    __slots__ = ("template", "_literals", "_fields")
+
+    def __init__(self, template):
+        self.template = template
+        self._literals = []
+        self._fields = []
+        # Escaped braces come back as separate literal pieces; merge them up to the next slot
+        pending = ""
+        for literal, field, _, _ in string.Formatter().parse(template):
+            pending += literal
+            if field is not None:
+                self._literals.append(pending)
+                self._fields.append(field)
+                pending = ""
+        self._literals.append(pending)
+
+    @property
+    def fields(self):
+        return tuple(self._fields)
+
+    def render(self, values):
+        parts = []
+        for literal, field in zip(self._literals, self._fields):
+            parts.append(literal)
+            parts.append(str(values[field]))
+        parts.append(self._literals[-1])
+        return "".join(parts)
+
+
+class ConversationChain:
+    """Sends the precompiled system message, recent history and the new input to the LLM"""
+
+    __slots__ = ("llm", "system_message", "history")
+
+    def __init__(self, llm, system_message, history):
+        self.llm = llm
+        self.system_message = system_message
+        self.history = history
+
+    def messages(self, input):
+        return [self.system_message, *self.history, HumanMessage(content=input)]
+
+    def predict(self, input):
+        return self.llm.invoke(self.messages(input)).content
+
+    async def apredict(self, input):
+        return (await self.llm.ainvoke(self.messages(input))).content
+
+
+class PromptRegistry:
+    """LLM prompts with their static parts built once at startup
+
+    The conversation system message is rendered per section, the summary
+    and PDF templates are parsed into CompiledPrompts and the PDF key list
+    is kept per combination of requested sections. Call sites only fill in
+    the per-session slots.
+    """
+
+    def __init__(self, sections, section_hints):
+        self.sections = tuple(sections)
+        self.section_hints = dict(section_hints)
+        self.conversation_system = {
+            section: SystemMessage(content=CONVERSATION_SYSTEM_PROMPT.format(
+                focus_area=section.replace("_", " ").title()
+            ))
+            for section in self.sections
+        }
+        self.summary_prompt = CompiledPrompt(SUMMARY_PROMPT)
+        self.pdf_parse_prompt = CompiledPrompt(PDF_PARSE_PROMPT)
+        # At most 2^len(sections) entries, one per set of sections the headings missed
+        self._pdf_keys = {}
+        self._generated_minute = None
+        self._generated = None
+
+    def conversation_chain(self, llm, section, session):
+        """Chain for the section with the session's memory summary and recent messages"""
+        system_message = self.conversation_system[section]
+        if session.summary:
+            system_message = SystemMessage(
+                content=system_message.content + EARLIER_CONVERSATION_PROMPT.format(summary=session.summary)
+            )
+        history = [
+            HumanMessage(content=content) if role == PATIENT else AIMessage(content=content)
+            for role, content, _ in session.messages
+        ]
+        return ConversationChain(llm, system_message, history)
+
+    def summary(self, section_data):
+        """EHR refinement prompt for the collected section data"""
+        values = {key: section_data.get(key, default) for key, default in SUMMARY_DEFAULTS.items()}
+        values["generated"] = self._generated_timestamp()
+        return self.summary_prompt.render(values)
+
+    def pdf_parse(self, text, sections=None):
+        """PDF extraction prompt asking for the given sections (all by default)"""
+        sections = tuple(sections) if sections else self.sections
+        keys = self._pdf_keys.get(sections)
+        if keys is None:
+            keys = self._pdf_keys[sections] = ",\n".join(
+                f'    "{section}": "{self.section_hints[section]}"' for section in sections
+            )
+        return self.pdf_parse_prompt.render({"text": text, "keys": keys})
+
+    def _generated_timestamp(self):
+        # The summary shows minutes, so the timestamp is formatted once per minute
+        minute = int(time.time() // 60)
+        if minute != self._generated_minute:
+            self._generated = datetime.now().strftime("%Y-%m-%d %H:%M")
+            self._generated_minute = minute
+        return self._generated
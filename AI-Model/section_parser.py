@@ -0,0 +1,81 @@
+import re
+
+
+class HeadingSectionExtractor:
+    """Rule-based extractor for documents with literal section headings
+
+    Recognizes lines such as "Allergies: Penicillin" or a bare "Family History"
+    heading followed by its text, using the same alias vocabulary as JSON
+    extraction. A section's text ends at the next known heading or a
+    blank-line gap; repeated values (the same heading on every page) are
+    kept once. A section is left out, so the LLM extracts it instead, when
+    its text grows past max_section_chars or holds another heading-shaped
+    line ("Mother: DM", "Vital Signs: ..."), which may be part of the
+    section or start one we do not know. The patterns are compiled once and
+    reused for every document.
+    """
+
+    # Blank-line gap that ends a section
+    BOUNDARY = re.compile(r"\n[ \t]*\n")
+    # A "Label:" line, which could continue the section or start an unknown one
+    LABEL_LINE = re.compile(r"^[ \t]*[A-Z][\w /&]{1,40}:", re.MULTILINE)
+
+    def __init__(self, section_aliases: dict, max_section_chars=500):
+        self.max_section_chars = max_section_chars
+        self._alias_to_section = {}
+        for section, aliases in section_aliases.items():
+            for alias in aliases:
+                self._alias_to_section[self._normalize(alias)] = section
+
+        # Longest aliases first so "past medical history" wins over "medical history"
+        alternatives = sorted(self._alias_to_section, key=len, reverse=True)
+        heading = "|".join(
+            r"[\s_\-]+".join(re.escape(word) for word in alias.split()) for alias in alternatives
+        )
+        # A heading is either "Heading: text" or a line holding only the heading
+        self._pattern = re.compile(
+            rf"^[ \t]*(?P<heading>{heading})[ \t]*(?::(?P<inline>[^\n]*)|[ \t]*$)",
+            re.IGNORECASE | re.MULTILINE
+        )
+
+    def extract(self, text: str) -> dict:
+        """Map section name to the text found under its heading(s)"""
+        matches = list(self._pattern.finditer(text))
+        values = {}
+        ambiguous = set()
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+            body = text[match.end():end]
+            inline = (match.group("inline") or "").strip()
+            if not inline:
+                # Under a bare heading the first line is always its text, even "Father: CAD"
+                body = body.lstrip()
+                first_line, _, body = body.partition("\n")
+                inline, body = first_line, "\n" + body
+            boundary = self.BOUNDARY.search(body)
+            if boundary is not None:
+                body = body[:boundary.start()]
+            section = self._alias_to_section[self._normalize(match.group("heading"))]
+            if self.LABEL_LINE.search(body):
+                ambiguous.add(section)
+            # Lines under a heading are usually list items
+            lines = [" ".join(line.split()) for line in [inline] + body.splitlines()]
+            values.setdefault(section, []).extend(line for line in lines if line)
+
+        found = {}
+        for section, lines in values.items():
+            unique = []
+            seen = set()
+            for line in lines:
+                if line.lower() not in seen:
+                    seen.add(line.lower())
+                    unique.append(line)
+            value = "; ".join(unique)
+            # Too long to be a heading's own text, or unclear where it ends: let the LLM extract it
+            if value and len(value) <= self.max_section_chars and section not in ambiguous:
+                found[section] = value
+        return found
+
+    @staticmethod
+    def _normalize(alias):
+        return " ".join(re.split(r"[\s_\-]+", alias.strip().lower()))
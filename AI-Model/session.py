@@ -0,0 +1,134 @@
+from conversation_memory import estimate_tokens, PATIENT, ASSISTANT
+
+# Interview sections in the order they are asked; a section is stored by its index
+SECTIONS = (
+    "chief_complaint",
+    "present_illness",
+    "past_medical_history",
+    "medications",
+    "allergies",
+    "family_history",
+    "social_history",
+    "review_of_systems"
+)
+SECTION_INDEX = {section: index for index, section in enumerate(SECTIONS)}
+
+# Value of each unanswered section; every session refers to these same strings
+SECTION_DEFAULTS = (
+    None,
+    None,
+    "None reported",
+    "None reported",
+    "No known allergies",
+    "None reported",
+    "None reported",
+    "No concerns reported"
+)
+
+# Canned text (defaults and assistant replies) by content, so sessions loaded
+# from an external store share one copy instead of each holding its own
+_shared = {value: value for value in SECTION_DEFAULTS if value is not None}
+_shared.update({PATIENT: PATIENT, ASSISTANT: ASSISTANT})
+
+
+def share(text):
+    """Register canned text and return the single shared copy of it"""
+    return _shared.setdefault(text, text)
+
+
+def is_shared(text):
+    """Whether text is the shared copy of registered canned text"""
+    return _shared.get(text) is text
+
+
+def _shared_copy(text):
+    return _shared.get(text, text)
+
+
+class Session:
+    """One patient's interview state
+
+    Section values live in a list indexed like SECTIONS, unanswered sections
+    point at the shared SECTION_DEFAULTS and assistant messages point at the
+    shared canned replies, so a session only owns what the patient typed.
+    summary, messages and memory_tokens are the ConversationMemory fields;
+    messages are (role, content, tokens) tuples. to_dict()/from_dict()
+    convert to the JSON layout used by the sqlite and redis stores.
+    """
+
+    __slots__ = ("section_index", "completed", "awaiting_file_response", "values",
+                 "summary", "messages", "memory_tokens")
+
+    def __init__(self):
+        self.section_index = 0
+        self.completed = False
+        self.awaiting_file_response = False
+        self.values = list(SECTION_DEFAULTS)
+        self.summary = ""
+        self.messages = []
+        self.memory_tokens = 0
+
+    @property
+    def current_section(self):
+        """Section being asked, or the last one once the interview is over"""
+        return SECTIONS[min(self.section_index, len(SECTIONS) - 1)]
+
+    @property
+    def section_data(self):
+        """Section values by name (a new dict, changes are not written back)"""
+        return dict(zip(SECTIONS, self.values))
+
+    def get_section(self, section):
+        return self.values[SECTION_INDEX[section]]
+
+    def set_section(self, section, value):
+        self.values[SECTION_INDEX[section]] = value
+
+    def to_dict(self):
+        return {
+            "section_index": self.section_index,
+            "completed": self.completed,
+            "awaiting_file_response": self.awaiting_file_response,
+            "section_data": self.section_data,
+            "memory": {
+                "summary": self.summary,
+                "messages": [list(message) for message in self.messages],
+                "tokens": self.memory_tokens
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a session from to_dict() output, or from the older dict layout
+        that kept a "history" list of "Patient: "/"Assistant: " strings"""
+        session = cls()
+        session.section_index = data["section_index"]
+        session.completed = data["completed"]
+        session.awaiting_file_response = data.get("awaiting_file_response", False)
+        section_data = data.get("section_data", {})
+        session.values = [
+            _shared_copy(section_data[section]) if section_data.get(section) is not None else default
+            for section, default in zip(SECTIONS, SECTION_DEFAULTS)
+        ]
+
+        # Patient messages repeat the section values; point both at one string
+        answers = {value: value for value in session.values if value is not None}
+        memory = data.get("memory")
+        if memory is not None:
+            session.summary = memory["summary"]
+            session.messages = [
+                (PATIENT, answers.get(content, content), tokens) if role == PATIENT
+                else (ASSISTANT, _shared_copy(content), tokens)
+                for role, content, tokens in memory["messages"]
+            ]
+            session.memory_tokens = memory["tokens"]
+        else:
+            for line in data.get("history", []):
+                if line.startswith("Patient: "):
+                    role, content = PATIENT, answers.get(line[len("Patient: "):]) or line[len("Patient: "):]
+                else:
+                    role, content = ASSISTANT, _shared_copy(line.replace("Assistant: ", "", 1))
+                tokens = estimate_tokens(content)
+                session.messages.append((role, content, tokens))
+                session.memory_tokens += tokens
+        return session
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from session import Session, share, is_shared
+from conversation_memory import ASSISTANT
+
+logger = logging.getLogger(__name__)
+
+# Record kinds of the snapshot file, one tab-separated record per line
+PUT = "p"
+DELETE = "d"
+CANNED = "c"
+
+
+class SessionSnapshotter:
+    """Periodic incremental snapshots of an InMemorySessionStore on local disk
+
+    The snapshot file is a journal of tab-separated lines:
+    "p <session_id> <last_access> <session JSON>" for a written session,
+    "d <session_id>" for a removed one and "c <n> <JSON string>" defining
+    canned reply n. Assistant messages that are canned replies are stored as
+    their number, so each reply is written once per file instead of once per
+    session. Every interval seconds only the sessions written or removed
+    since the previous run are appended. When the journal holds more than
+    compact_ratio records per live session, it is rewritten with one record
+    per session through a temporary file and os.replace, so a crash never
+    leaves a half-written snapshot. load() replays the journal into the
+    store at startup, decoding only the newest readable record of each live
+    session, and truncates a torn last line so later appends start on a
+    fresh line. stop() makes a final flush, so a restart keeps every session
+    that was saved before it.
+    """
+
+    def __init__(self, store, path, interval=30, compact_ratio=2.0):
+        self.store = store
+        self.path = path
+        self.interval = interval
+        self.compact_ratio = compact_ratio
+        self._records = 0
+        # Canned reply text -> number, for the replies already defined in the file
+        self._canned = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._loaded = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        store.track_changes()
+
+    def load(self):
+        """Restore sessions from the snapshot file; returns how many were loaded"""
+        if self._loaded:
+            return 0
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return 0
+
+        start = time.perf_counter()
+        # Every PUT of a live session, oldest first, so an unreadable newest
+        # record falls back to the one before it
+        entries = {}
+        canned = []
+        records = 0
+        complete_bytes = 0
+        with open(self.path, "rb") as f:
+            for line_number, raw in enumerate(f, 1):
+                if not raw.endswith(b"\n"):
+                    # Torn by a crash during an append; cut off below so the
+                    # next flush does not glue its first record onto it
+                    logger.warning("Dropping torn snapshot line %d", line_number)
+                    break
+                complete_bytes += len(raw)
+                try:
+                    fields = raw[:-1].decode("utf-8").split("\t", 3)
+                    kind = fields[0]
+                    if kind == PUT and len(fields) == 4:
+                        entries.setdefault(fields[1], []).append((float(fields[2]), fields[3], line_number))
+                    elif kind == DELETE and len(fields) == 2:
+                        entries.pop(fields[1], None)
+                    elif kind == CANNED and len(fields) == 3 and int(fields[1]) == len(canned):
+                        canned.append(share(json.loads(fields[2])))
+                    else:
+                        raise ValueError(kind)
+                except ValueError:
+                    logger.warning("Skipping unreadable snapshot line %d", line_number)
+                    continue
+                records += 1
+        if complete_bytes < os.path.getsize(self.path):
+            os.truncate(self.path, complete_bytes)
+
+        restored = []
+        for session_id, puts in entries.items():
+            for last_access, payload, line_number in reversed(puts):
+                session = self._decode(payload, canned, line_number)
+                if session is not None:
+                    restored.append((session_id, session, last_access))
+                    break
+
+        loaded = self.store.restore(restored)
+        # Restoring marks nothing as changed; the journal already holds these records
+        self.store.drain_changes()
+        self._records = records
+        self._canned = {text: number for number, text in enumerate(canned)}
+        logger.info("Restored %d sessions from %s in %.2fs", loaded, self.path, time.perf_counter() - start)
+        return loaded
+
+    @staticmethod
+    def _decode(payload, canned, line_number):
+        """Session from a PUT record's JSON, or None when it cannot be read"""
+        try:
+            data = json.loads(payload)
+            for message in data["memory"]["messages"]:
+                if type(message[1]) is int:
+                    message[1] = canned[message[1]]
+            return Session.from_dict(data)
+        except (ValueError, KeyError, IndexError, TypeError):
+            logger.warning("Skipping unreadable snapshot line %d", line_number)
+            return None
+
+    def flush(self):
+        """Append the sessions changed since the last flush, compacting the file when due"""
+        with self._lock:
+            changed, removed = self.store.drain_changes()
+            if not changed and not removed:
+                return 0
+            lines = [f"{DELETE}\t{session_id}" for session_id in removed]
+            lines.extend(_put(entry, self._canned, lines) for entry in changed)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._records += len(lines)
+
+            if self._records > self.compact_ratio * max(len(self.store), 1) + 100:
+                self._compact()
+            return len(lines)
+
+    def _compact(self):
+        """Rewrite the journal with one record per live session"""
+        entries = self.store.entries()
+        canned = {}
+        lines = []
+        for entry in entries:
+            lines.append(_put(entry, canned, lines))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                if lines:
+                    f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self._canned = canned
+        self._records = len(lines)
+        logger.debug("Compacted session snapshot to %d sessions", len(entries))
+
+    def start(self):
+        """Start the background thread that flushes every interval seconds"""
+        if self._thread is not None or not self.interval:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="session-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and write a final flush"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Session snapshot failed")
+
+
+def _put(entry, canned, lines):
+    """PUT line for a (session_id, session, last_access) entry; canned replies
+    missing from canned are numbered and their definitions appended to lines"""
+    session_id, session, last_access = entry
+    data = session.to_dict()
+    for message in data["memory"]["messages"]:
+        content = message[1]
+        if message[0] == ASSISTANT and is_shared(content):
+            number = canned.get(content)
+            if number is None:
+                number = canned[content] = len(canned)
+                lines.append(f"{CANNED}\t{number}\t{_dumps(content)}")
+            message[1] = number
+    return f"{PUT}\t{session_id}\t{last_access:.3f}\t{_dumps(data)}"
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,424 @@
+import json
+import time
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from session import Session
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    """Interface shared by all session backends
+    
+    Sessions are Session objects; external backends store their to_dict()
+    JSON and rebuild them with Session.from_dict(). Callers must write a session
+    back with ``store[session_id] = session`` after mutating it, since external
+    backends hand out copies rather than live objects.
+    """
+
+    def __init__(self, max_sessions=10000, idle_ttl=7200, sweep_interval=60):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._stop = threading.Event()
+        self._sweeper = None
+
+    @abstractmethod
+    def get(self, session_id, default=None):
+        """Return a session and mark it as recently used"""
+
+    @abstractmethod
+    def __setitem__(self, session_id, session):
+        """Store a session and mark it as recently used"""
+
+    @abstractmethod
+    def pop(self, session_id, default=None):
+        """Remove and return a session"""
+
+    @abstractmethod
+    def sweep(self):
+        """Evict every session idle for longer than the TTL"""
+
+    @abstractmethod
+    def stats(self):
+        """Current size and eviction counters"""
+
+    @abstractmethod
+    def __len__(self):
+        """Number of stored sessions"""
+
+    def __getitem__(self, session_id):
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __delitem__(self, session_id):
+        if self.pop(session_id) is None:
+            raise KeyError(session_id)
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def start_sweeper(self):
+        """Start the background thread that periodically runs sweep()"""
+        if self._sweeper is not None or not self.sweep_interval or not self.idle_ttl:
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        """Stop the background sweeper thread"""
+        if self._sweeper is None:
+            return
+        self._stop.set()
+        self._sweeper.join(timeout=5)
+        self._sweeper = None
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Session sweep failed")
+
+
+class InMemorySessionStore(SessionStore):
+    """Bounded in-process session store with idle TTL and LRU eviction
+
+    Sessions are kept in access order, so the least recently used session is
+    always first. That makes both LRU eviction and the TTL sweep cheap: the
+    sweep stops at the first session that is still fresh.
+    """
+
+    def __init__(self, max_sessions=10000, idle_ttl=7200, sweep_interval=60):
+        super().__init__(max_sessions, idle_ttl, sweep_interval)
+        self._sessions = OrderedDict()
+        self._last_access = {}
+        self._lock = threading.RLock()
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        # Sessions written or removed since the last snapshot (None when not snapshotting)
+        self._changed = None
+        self._removed = None
+
+    def get(self, session_id, default=None):
+        """Return a session and mark it as recently used"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return default
+            if self._is_expired(session_id, time.monotonic()):
+                self._remove(session_id)
+                self.evicted_ttl += 1
+                return default
+            self._touch(session_id)
+            return session
+
+    def __setitem__(self, session_id, session):
+        with self._lock:
+            self._sessions[session_id] = session
+            self._touch(session_id)
+            if self._changed is not None:
+                self._changed.add(session_id)
+                self._removed.discard(session_id)
+            while len(self._sessions) > self.max_sessions:
+                oldest_id = next(iter(self._sessions))
+                self._remove(oldest_id)
+                self.evicted_lru += 1
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def pop(self, session_id, default=None):
+        """Remove and return a session"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return default
+            self._remove(session_id)
+            return session
+
+    def sweep(self):
+        """Evict every session idle for longer than the TTL"""
+        if not self.idle_ttl:
+            return 0
+        now = time.monotonic()
+        evicted = 0
+        with self._lock:
+            while self._sessions:
+                oldest_id = next(iter(self._sessions))
+                if not self._is_expired(oldest_id, now):
+                    break
+                self._remove(oldest_id)
+                evicted += 1
+            self.evicted_ttl += evicted
+        return evicted
+
+    def stats(self):
+        """Current size and eviction counters"""
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl
+        }
+
+    def _touch(self, session_id):
+        self._sessions.move_to_end(session_id)
+        self._last_access[session_id] = time.monotonic()
+
+    def _is_expired(self, session_id, now):
+        return bool(self.idle_ttl) and now - self._last_access[session_id] > self.idle_ttl
+
+    def _remove(self, session_id):
+        del self._sessions[session_id]
+        del self._last_access[session_id]
+        if self._changed is not None:
+            self._changed.discard(session_id)
+            self._removed.add(session_id)
+
+    def track_changes(self):
+        """Start recording written and removed sessions for drain_changes()"""
+        with self._lock:
+            if self._changed is None:
+                self._changed = set()
+                self._removed = set()
+
+    def drain_changes(self):
+        """Sessions written and IDs removed since the previous call
+
+        Written sessions come as (session_id, session, last_access) with
+        last_access as wall-clock time, so it stays meaningful after a restart.
+        """
+        with self._lock:
+            changed, removed = self._changed, self._removed
+            self._changed, self._removed = set(), set()
+            return [self._entry(session_id) for session_id in changed], list(removed)
+
+    def entries(self):
+        """Every session as (session_id, session, last_access), least recently used first"""
+        with self._lock:
+            return [self._entry(session_id) for session_id in self._sessions]
+
+    def restore(self, entries):
+        """Load (session_id, session, last_access) entries, e.g. from a snapshot
+
+        Entries idle past the TTL are skipped and the most recently used
+        max_sessions are kept, in LRU order.
+        """
+        now, wall_now = time.monotonic(), time.time()
+        fresh = [entry for entry in entries if not self.idle_ttl or wall_now - entry[2] <= self.idle_ttl]
+        fresh.sort(key=lambda entry: entry[2])
+        with self._lock:
+            for session_id, session, last_access in fresh[-self.max_sessions:]:
+                self._sessions[session_id] = session
+                self._sessions.move_to_end(session_id)
+                self._last_access[session_id] = now - (wall_now - last_access)
+            while len(self._sessions) > self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+        return len(fresh[-self.max_sessions:])
+
+    def _entry(self, session_id):
+        idle = time.monotonic() - self._last_access[session_id]
+        return session_id, self._sessions[session_id], time.time() - idle
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in a WAL-mode SQLite file shared by all worker processes"""
+
+    def __init__(self, path="sessions.db", max_sessions=10000, idle_ttl=7200, sweep_interval=60):
+        super().__init__(max_sessions, idle_ttl, sweep_interval)
+        self.path = path
+        # sqlite3 connections cannot be shared across threads
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS session_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id, default=None):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data, last_access FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return default
+            if self.idle_ttl and now - row[1] > self.idle_ttl:
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._increment(conn, "evicted_ttl", 1)
+                return default
+            conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return Session.from_dict(json.loads(row[0]))
+
+    def __setitem__(self, session_id, session):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, last_access) VALUES (?, ?, ?)",
+                (session_id, json.dumps(session.to_dict()), time.time())
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM sessions WHERE session_id IN "
+                    "(SELECT session_id FROM sessions ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                )
+                self._increment(conn, "evicted_lru", excess)
+
+    def pop(self, session_id, default=None):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return default
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return Session.from_dict(json.loads(row[0]))
+
+    def sweep(self):
+        if not self.idle_ttl:
+            return 0
+        with self._connect() as conn:
+            evicted = conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (time.time() - self.idle_ttl,)
+            ).rowcount
+            if evicted:
+                self._increment(conn, "evicted_ttl", evicted)
+        return evicted
+
+    def stats(self):
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM session_counters").fetchall())
+        return {
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evicted_lru": counters.get("evicted_lru", 0),
+            "evicted_ttl": counters.get("evicted_ttl", 0)
+        }
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _increment(self, conn, name, amount):
+        conn.execute(
+            "INSERT INTO session_counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+
+class RedisSessionStore(SessionStore):
+    """Session store on any Redis-protocol server
+    
+    Idle expiry uses native key TTLs; a sorted set of last-access times drives
+    LRU eviction and lets the sweeper count expired sessions. Requires the
+    optional ``redis`` package unless a compatible ``client`` is passed in.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", max_sessions=10000, idle_ttl=7200,
+                 sweep_interval=60, client=None, prefix="docai"):
+        super().__init__(max_sessions, idle_ttl, sweep_interval)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._lru_key = f"{prefix}:sessions:lru"
+
+    def _key(self, session_id):
+        return f"{self.prefix}:session:{session_id}"
+
+    def get(self, session_id, default=None):
+        data = self.client.get(self._key(session_id))
+        if data is None:
+            return default
+        pipe = self.client.pipeline()
+        if self.idle_ttl:
+            pipe.expire(self._key(session_id), int(self.idle_ttl))
+        pipe.zadd(self._lru_key, {session_id: time.time()})
+        pipe.execute()
+        return Session.from_dict(json.loads(data))
+
+    def __setitem__(self, session_id, session):
+        pipe = self.client.pipeline()
+        if self.idle_ttl:
+            pipe.set(self._key(session_id), json.dumps(session.to_dict()), ex=int(self.idle_ttl))
+        else:
+            pipe.set(self._key(session_id), json.dumps(session.to_dict()))
+        pipe.zadd(self._lru_key, {session_id: time.time()})
+        pipe.zcard(self._lru_key)
+        size = pipe.execute()[-1]
+        excess = size - self.max_sessions
+        if excess > 0:
+            oldest = self.client.zpopmin(self._lru_key, excess)
+            if oldest:
+                self.client.delete(*[self._key(self._decode(sid)) for sid, _ in oldest])
+                self.client.incrby(f"{self.prefix}:sessions:evicted_lru", len(oldest))
+
+    def pop(self, session_id, default=None):
+        pipe = self.client.pipeline()
+        pipe.get(self._key(session_id))
+        pipe.delete(self._key(session_id))
+        pipe.zrem(self._lru_key, session_id)
+        data = pipe.execute()[0]
+        return default if data is None else Session.from_dict(json.loads(data))
+
+    def sweep(self):
+        # Keys expire on their own; drop their LRU entries and count them
+        if not self.idle_ttl:
+            return 0
+        evicted = self.client.zremrangebyscore(self._lru_key, "-inf", time.time() - self.idle_ttl)
+        if evicted:
+            self.client.incrby(f"{self.prefix}:sessions:evicted_ttl", evicted)
+        return evicted
+
+    def stats(self):
+        evicted_lru, evicted_ttl = self.client.mget(
+            f"{self.prefix}:sessions:evicted_lru", f"{self.prefix}:sessions:evicted_ttl"
+        )
+        return {
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evicted_lru": int(evicted_lru or 0),
+            "evicted_ttl": int(evicted_ttl or 0)
+        }
+
+    def __len__(self):
+        return self.client.zcard(self._lru_key)
+
+    def _decode(self, value):
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def create_session_store(backend="memory", max_sessions=10000, idle_ttl=7200, sweep_interval=60,
+                         sqlite_path="sessions.db", redis_url="redis://localhost:6379/0"):
+    """Build the session store selected by name: memory, sqlite or redis"""
+    if backend == "memory":
+        return InMemorySessionStore(max_sessions, idle_ttl, sweep_interval)
+    if backend == "sqlite":
+        return SQLiteSessionStore(sqlite_path, max_sessions, idle_ttl, sweep_interval)
+    if backend == "redis":
+        return RedisSessionStore(redis_url, max_sessions, idle_ttl, sweep_interval)
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import contextvars
+from metrics import SINGLEFLIGHT_SHARED
+from llm_scheduler import SharedPriority, current_priority, priority_level
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution
+
+    The first caller for a key runs the function; callers that arrive while
+    it is in flight wait and receive the same result (or exception). Nothing
+    is remembered once the call finishes, so this complements a cache rather
+    than replacing it. Threaded callers use do(), coroutines use ado(); the
+    two do not share in-flight calls.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn() once for all threads calling with key at the same time"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            SINGLEFLIGHT_SHARED.inc(flight=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn, priority=None):
+        """Await fn() once for all coroutines calling with key at the same time
+
+        priority is the caller's LLM scheduler priority. The shared call runs
+        at the most urgent priority of its callers, including ones that join
+        while it is queued, instead of the current_priority of whichever
+        caller happened to start it.
+        """
+        entry = self._tasks.get(key)
+        if entry is None:
+            shared = SharedPriority(priority_level(priority)) if priority is not None else None
+            context = contextvars.copy_context()
+            context.run(current_priority.set, shared)
+            task = context.run(asyncio.ensure_future, fn())
+            self._tasks[key] = (task, shared)
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            task, shared = entry
+            if shared is not None and priority is not None:
+                shared.join(priority)
+            SINGLEFLIGHT_SHARED.inc(flight=self.name)
+        # A caller that disconnects must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        entry = self._tasks.get(key)
+        if entry is not None and entry[0] is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
@@ -0,0 +1,137 @@
+import time
+import uuid
+import asyncio
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from llm_scheduler import BATCH, current_priority
+
+
+class SummaryJobQueue(ABC):
+    """Interface for bulk summary generation backends
+
+    A job is a list of session IDs. submit() returns immediately with the job
+    record; get() returns its progress and the summaries finished so far.
+    """
+
+    @abstractmethod
+    def submit(self, session_ids):
+        """Enqueue summaries for the given sessions and return the job record"""
+
+    @abstractmethod
+    def get(self, job_id):
+        """Return the job record, or None if unknown"""
+
+    async def start(self):
+        """Start the workers"""
+
+    async def stop(self):
+        """Stop the workers"""
+
+
+class InProcessSummaryJobQueue(SummaryJobQueue):
+    """Runs batch summaries on a fixed pool of asyncio workers in this process
+
+    Work items are (job_id, session_id) pairs on a single queue, so the number
+    of workers bounds LLM concurrency across all jobs. Only the most recent
+    max_jobs job records are kept, and finished ones expire job_ttl seconds
+    after they complete. Records live in this process only, so a job can
+    only be polled on the worker process that accepted it.
+    """
+
+    def __init__(self, bot, workers=4, max_jobs=1000, job_ttl=3600):
+        self.bot = bot
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.job_ttl = job_ttl
+        self._jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+
+    def submit(self, session_ids):
+        self._ensure_started()
+        job_id = str(uuid.uuid4())
+        session_ids = list(dict.fromkeys(session_ids))
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "total": len(session_ids),
+            "completed": 0,
+            "failed": 0,
+            "results": {},
+            "created_at": time.time(),
+            "finished_at": None
+        }
+        self._expire()
+        self._jobs[job_id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+        for session_id in session_ids:
+            self._queue.put_nowait((job_id, session_id))
+        return job
+
+    def get(self, job_id):
+        self._expire()
+        return self._jobs.get(job_id)
+
+    async def start(self):
+        self._ensure_started()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def _expire(self):
+        if not self.job_ttl:
+            return
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] is not None and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _ensure_started(self):
+        # Workers must be created on the running event loop
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        # Batch LLM calls yield to interactive summaries and file extraction
+        current_priority.set(BATCH)
+        while True:
+            job_id, session_id = await self._queue.get()
+            job = None
+            try:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job["status"] = "running"
+                    result = await self._summarize(session_id)
+                    self._record(job, session_id, result)
+            except Exception as e:
+                if job is not None:
+                    self._record(job, session_id, {"error": f"Failed to generate summary: {str(e)}"})
+            finally:
+                self._queue.task_done()
+
+    async def _summarize(self, session_id):
+        session = self.bot.sessions.get(session_id)
+        if session is None:
+            return {"error": "Invalid session ID"}
+        if not session.completed:
+            return {"error": "Conversation not yet completed"}
+        return {"summary": await self.bot.agenerate_summary(session_id)}
+
+    def _record(self, job, session_id, result):
+        job["results"][session_id] = result
+        if "error" in result:
+            job["failed"] += 1
+        else:
+            job["completed"] += 1
+        if job["completed"] + job["failed"] >= job["total"]:
+            job["status"] = "completed"
+            job["finished_at"] = time.time()
@@ -0,0 +1,66 @@
+"""
+Regression tests for rule-based section extraction from uploaded files
+
+Runs without a server or API key: python test_section_extraction.py (or pytest)
+"""
+import io
+from chatbot_main import ClinicalChatbot
+from json_extraction import JSONSectionExtractor
+from section_parser import HeadingSectionExtractor
+
+
+def json_extractor():
+    return JSONSectionExtractor(ClinicalChatbot.SECTION_ALIASES)
+
+
+def test_json_null_and_empty_values_are_skipped():
+    # Uploads arrive as streams; a matched key with no value must not turn
+    # the rest of the document into a parse error
+    for document in ('{"allergies": null, "name": "x"}', '{"medications": [], "patient": "x"}'):
+        assert json_extractor().extract(io.StringIO(document)) == {}
+        assert json_extractor().extract(document) == {}
+
+
+def test_json_malformed_document_is_reported():
+    for document in ('{"not json', '{"a" 1}'):
+        for source in (document, io.StringIO(document)):
+            try:
+                json_extractor().extract(source)
+            except ValueError as e:
+                assert str(e).startswith("Invalid JSON format")
+            else:
+                raise AssertionError(f"{document!r} was accepted")
+
+
+def test_json_preferred_alias_wins():
+    document = '{"reason": "routine", "chief_complaint": "cough"}'
+    assert json_extractor().extract(io.StringIO(document)) == {"chief_complaint": "cough"}
+
+
+def heading_extractor():
+    return HeadingSectionExtractor(ClinicalChatbot.SECTION_ALIASES)
+
+
+def test_heading_section_with_label_lines_is_left_to_llm():
+    # "Mother: DM" may belong to the family history; keeping only the first
+    # line would mark the section found and lose the rest
+    assert "family_history" not in heading_extractor().extract("Family History\nFather: MI at 60\nMother: DM")
+    assert "allergies" not in heading_extractor().extract("Allergies: Penicillin\nVital Signs: BP 120/80")
+
+
+def test_heading_section_ends_at_known_heading_or_blank_line():
+    text = "Medications:\n- Metformin\n- Lisinopril\nAllergies: Penicillin\n\nFather: CAD"
+    assert heading_extractor().extract(text) == {
+        "medications": "- Metformin; - Lisinopril",
+        "allergies": "Penicillin"
+    }
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SECTION EXTRACTION REGRESSION TESTS")
+    print("=" * 80)
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"✅ {name}")
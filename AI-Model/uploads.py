@@ -0,0 +1,199 @@
+import io
+import os
+import mmap
+import codecs
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadTooLarge(ValueError):
+    """Upload crossed the size limit while it was being read"""
+
+
+class MalformedUpload(ValueError):
+    """Request body is not a readable multipart/form-data upload"""
+
+
+class SpooledUpload:
+    """Uploaded file content, kept in memory when small and in a temp file otherwise
+
+    Uploads up to spool_bytes stay as bytes in data; larger ones are written
+    to the temp file at path and only mapped into memory while they are read,
+    so the process never holds a large upload on its heap. The SHA-256 is
+    computed while the upload is read. Instances are small and picklable, so
+    a PDF worker process can map the temp file itself instead of receiving
+    a copy of its bytes. close() deletes the temp file.
+    """
+
+    __slots__ = ("data", "path", "size", "sha256")
+
+    def __init__(self, data=None, path=None, size=0, sha256=None):
+        self.data = data
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def __len__(self):
+        return self.size
+
+    @contextmanager
+    def buffer(self):
+        """Content as bytes, or as a read-only mmap of the temp file"""
+        if self.path is None:
+            yield self.data
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+    def text(self, encoding="utf-8"):
+        """Text file object over the content, read from the temp file in place"""
+        if self.path is None:
+            return io.TextIOWrapper(io.BytesIO(self.data), encoding=encoding)
+        return open(self.path, "r", encoding=encoding)
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self.data = None
+
+
+class UploadSpool:
+    """Writer that builds a SpooledUpload from chunks of an upload
+
+    Raises UploadTooLarge as soon as more than max_bytes (0 = no limit) have
+    been written, and UnicodeDecodeError when encoding is given and the content
+    does not decode, without ever holding more than spool_bytes in memory.
+    """
+
+    def __init__(self, max_bytes=0, spool_bytes=1024 * 1024, spool_dir=None, encoding=None):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.spool_dir = spool_dir
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._decoder = codecs.getincrementaldecoder(encoding)() if encoding else None
+        self._head = bytearray()
+        self._spool = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLarge(f"File is larger than the {self.max_bytes // 1024} KB limit")
+        self._digest.update(chunk)
+        if self._decoder is not None:
+            self._decoder.decode(chunk)
+        if self._spool is None and len(self._head) + len(chunk) > self.spool_bytes:
+            self._spool = tempfile.NamedTemporaryFile(prefix="upload-", dir=self.spool_dir, delete=False)
+            self._spool.write(self._head)
+            self._head = None
+        if self._spool is None:
+            self._head += chunk
+        else:
+            self._spool.write(chunk)
+
+    def finish(self):
+        """The SpooledUpload of everything written"""
+        if self._decoder is not None:
+            self._decoder.decode(b"", final=True)
+        if self._spool is None:
+            return SpooledUpload(data=bytes(self._head), size=self.size, sha256=self._digest.hexdigest())
+        self._spool.close()
+        return SpooledUpload(path=self._spool.name, size=self.size, sha256=self._digest.hexdigest())
+
+    def discard(self):
+        """Delete the temp file of an upload that was not finished"""
+        if self._spool is not None:
+            self._spool.close()
+            os.unlink(self._spool.name)
+            self._spool = None
+
+
+async def read_multipart_file(request, open_spool, field_name="file"):
+    """Stream the file field of a multipart/form-data request into an UploadSpool
+
+    The request body is parsed as it arrives, so the file is written once,
+    straight into the spool, and a body without Content-Length stops being
+    read as soon as the spool's limit is crossed. open_spool(filename) is
+    called once the part's headers are read and returns the UploadSpool for
+    its content, or raises to reject the file before any of it is read.
+    Returns (filename, SpooledUpload), or (None, None) without a file field.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise MalformedUpload("Expected a multipart/form-data upload")
+
+    reader = _FileFieldReader(field_name.encode(), open_spool)
+    parser = MultipartParser(boundary, reader.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+        if reader.spool is None:
+            return None, None
+        return reader.filename, reader.spool.finish()
+    except BaseException as e:
+        if reader.spool is not None:
+            reader.spool.discard()
+        if isinstance(e, FormParserError):
+            raise MalformedUpload(f"Invalid multipart upload: {e}") from e
+        raise
+
+
+class _FileFieldReader:
+    """Multipart parser callbacks that write the first file part named field_name to a spool"""
+
+    def __init__(self, field_name, open_spool):
+        self.field_name = field_name
+        self.open_spool = open_spool
+        self.filename = None
+        self.spool = None
+        # Spool of the part being read, None while any other part is read
+        self._target = None
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, disposition = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.spool is None and disposition.get(b"name") == self.field_name and b"filename" in disposition:
+            self.filename = disposition[b"filename"].decode("utf-8", "replace")
+            self.spool = self._target = self.open_spool(self.filename)
+
+    def on_part_data(self, data, start, end):
+        if self._target is not None:
+            self._target.write(data[start:end])
+
+    def on_part_end(self):
+        self._target = None
@@ -29,15 +29,15 @@ export const analyzeReport = asyncHandler(async (req: Request, res: Response) =>
     return;
   }
 
-  // Call AI Model API to analyze file (POST /session/new/with-file)
-  // We use the session endpoint but won't save the session in DB
+  // Call AI Model API to extract and summarize the file in one request (POST /analyze)
+  // No session is created on the AI side and none is saved in DB
   const formData = new FormData();
   formData.append('file', req.file.buffer, {
     filename: req.file.originalname,
     contentType: req.file.mimetype
   });
 
-  const aiResponse = await fetch(`${config.aiModelBaseUrl}/session/new/with-file`, {
+  const aiResponse = await fetch(`${config.aiModelBaseUrl}/analyze`, {
     method: 'POST',
     body: formData as any,
     headers: formData.getHeaders()
@@ -50,10 +50,9 @@ export const analyzeReport = asyncHandler(async (req: Request, res: Response) =>
   }
 
   const aiData = await aiResponse.json() as {
-    session_id?: string;
-    welcome_message?: string;
     pre_filled_sections?: string[];
     extracted_data?: any;
+    summary?: string;
     error?: string;
   };
 
@@ -65,32 +64,9 @@ export const analyzeReport = asyncHandler(async (req: Request, res: Response) =>
     return;
   }
 
-  const aiSessionId = aiData.session_id || '';
   const preFilledSections = aiData.pre_filled_sections || [];
   const extractedData = aiData.extracted_data || {};
-
-  // Now get the summary from AI using the temporary session
-  let summary: string = '';
-
-  try {
-    const summaryResponse = await fetch(`${config.aiModelBaseUrl}/summary/${aiSessionId}`, {
-      method: 'GET'
-    });
-
-    if (summaryResponse.ok) {
-      const summaryData = await summaryResponse.json() as {
-        summary?: string;
-        error?: string;
-      };
-
-      if (!summaryData.error) {
-        summary = summaryData.summary || '';
-      }
-    }
-  } catch (summaryError) {
-    console.warn('Failed to get summary, continuing without it:', summaryError);
-    // Continue without summary - not critical
-  }
+  const summary = aiData.summary || '';
 
   // Return analysis without creating conversation in DB
   res.status(200).json({